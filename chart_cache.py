@@ -0,0 +1,48 @@
+"""Content-hash cache for rendered charts.
+
+Each chart is keyed by a hash of the data it plots together with its
+rendering parameters.  The key is stored next to the image as
+``<image>.key``; when the stored key matches and the image exists, the chart
+script can skip the matplotlib render and PNG encode.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+
+def chart_key(data, params) -> str:
+    """Return a stable hash of the plotted data and rendering parameters."""
+    payload = json.dumps({"data": data, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def key_path(output) -> Path:
+    """Return the path of the key file stored next to ``output``."""
+    output = Path(output)
+    return output.with_name(output.name + ".key")
+
+
+def is_fresh(output, key: str) -> bool:
+    """Return True if ``output`` exists and was rendered from ``key``."""
+    path = key_path(output)
+    if not Path(output).exists() or not path.exists():
+        return False
+    return path.read_text().strip() == key
+
+
+def store_key(output, key: str) -> None:
+    """Record that ``output`` was rendered from ``key``."""
+    key_path(output).write_text(key + "\n")
+
+
+def render_cached(output, data, params, render, force: bool = False) -> bool:
+    """Call ``render()`` unless ``output`` is up to date; return True if rebuilt."""
+    key = chart_key(data, params)
+    if not force and is_fresh(output, key):
+        print(f"{output}: unchanged, skipped")
+        return False
+    render()
+    store_key(output, key)
+    print(f"{output}: rebuilt")
+    return True
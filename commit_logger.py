@@ -1,6 +1,8 @@
 import os
 import subprocess
 import sqlite3
+import sys
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from urllib.parse import urlparse
@@ -27,7 +29,8 @@ def collect_commits(repo: Path, since: datetime):
     if not data:
         return commits
     for record in data.split('\x1e'):
-        parts = record.split('\x1f')
+        # git log separates records with a newline after our terminator
+        parts = record.lstrip('\n').split('\x1f')
         if len(parts) != 3:
             continue
         h, ts, msg = parts
@@ -35,6 +38,71 @@ def collect_commits(repo: Path, since: datetime):
     return commits
 
 
+BACKFILL_FORMAT = '%x1e' + '%x1f'.join(['%H', '%cI', '%s', '%an', '%ae', '%aI', '%cn', '%ce'])
+BACKFILL_BATCH = 1000
+
+# Columns added by the full-history backfill; NULL for commits logged by
+# collect_commits only.
+DETAIL_COLUMNS = {
+    'author_name': 'TEXT',
+    'author_email': 'TEXT',
+    'author_time': 'TEXT',
+    'committer_name': 'TEXT',
+    'committer_email': 'TEXT',
+    'files_changed': 'INTEGER',
+    'insertions': 'INTEGER',
+    'deletions': 'INTEGER',
+}
+
+
+def iter_history(repo: Path, since_hash: str = None):
+    """Stream every commit on HEAD with its diffstat, parents before children.
+
+    Yields (hash, timestamp, message, author_name, author_email,
+    author_time, committer_name, committer_email, files_changed,
+    insertions, deletions) tuples parsed from a single
+    ``git log --numstat`` process.  With ``since_hash`` only commits that
+    are not ancestors of it are listed.  Binary files count as changed
+    files without insertions or deletions; merges have no diffstat.
+    """
+    cmd = ['git', 'log', '--reverse', '--topo-order', '--numstat', '--no-renames',
+           f'--format={BACKFILL_FORMAT}', 'HEAD']
+    if since_hash:
+        cmd.append(f'^{since_hash}')
+    proc = subprocess.Popen(cmd, cwd=repo, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            text=True, errors='replace')
+    try:
+        header = None
+        files = insertions = deletions = 0
+        for line in proc.stdout:
+            if line.startswith('\x1e'):
+                if header:
+                    yield (*header, files, insertions, deletions)
+                header = line[1:].rstrip('\n').split('\x1f')
+                if len(header) != 8:
+                    header = None
+                files = insertions = deletions = 0
+            elif header and line.strip():
+                added, removed, _ = line.split('\t', 2)
+                files += 1
+                insertions += int(added) if added != '-' else 0
+                deletions += int(removed) if removed != '-' else 0
+        if header:
+            yield (*header, files, insertions, deletions)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+def is_ancestor(repo: Path, commit: str) -> bool:
+    """Return True if ``commit`` exists and is an ancestor of HEAD."""
+    result = subprocess.run(['git', 'merge-base', '--is-ancestor', commit, 'HEAD'],
+                            cwd=repo, capture_output=True)
+    return result.returncode == 0
+
+
 def repo_identifier(repo: Path) -> str:
     """Return a consistent identifier for the repository based on its remote."""
     result = subprocess.run(
@@ -61,39 +129,290 @@ def repo_identifier(repo: Path) -> str:
     return url
 
 
+ROLLUP_TABLE = 'daily_commits'
+
+
+def fix_hash_newlines(conn) -> bool:
+    """Strip the newline older versions of collect_commits left before hashes.
+
+    Those rows were logged again under the clean hash by later runs, so a
+    prefixed row is dropped where the clean one exists and renamed
+    otherwise.  Returns True if anything changed.
+    """
+    if not conn.execute(
+        "SELECT 1 FROM commits WHERE substr(hash, 1, 1) = char(10) LIMIT 1"
+    ).fetchone():
+        return False
+    with conn:
+        conn.execute(
+            "DELETE FROM commits WHERE substr(hash, 1, 1) = char(10) AND EXISTS "
+            "(SELECT 1 FROM commits AS clean WHERE clean.repo = commits.repo "
+            "AND clean.hash = ltrim(commits.hash, char(10)))"
+        )
+        conn.execute(
+            "UPDATE commits SET hash = ltrim(hash, char(10)) WHERE substr(hash, 1, 1) = char(10)"
+        )
+    return True
+
+
+def _utc(column: str) -> str:
+    """SQL converting an ISO 8601 timestamp with UTC offset to UTC."""
+    return f"strftime('%Y-%m-%dT%H:%M:%SZ', {column})"
+
+
+def ensure_rollups(conn, rebuild: bool = False) -> None:
+    """Create the per-repo, per-day rollup table and the trigger maintaining it.
+
+    ``daily_commits`` holds the number of commits and the first and last
+    commit timestamp for every repository and day (the date part of the
+    committer timestamp, as in daily_timesheet).  The first and last
+    timestamps are converted to UTC, so commits made in different time
+    zones compare by the instant they were made.  An insert trigger on
+    ``commits`` keeps the table up to date, so rows skipped by INSERT OR
+    IGNORE or updated by the backfill are not counted twice.  The table is
+    built from the existing commits the first time it is created, when the
+    trigger definition changes, or again with ``rebuild``.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (ROLLUP_TABLE,)
+    ).fetchone()
+    trigger = f'{ROLLUP_TABLE}_insert'
+    trigger_sql = (
+        f'CREATE TRIGGER {trigger} AFTER INSERT ON commits '
+        f'BEGIN '
+        f'INSERT INTO {ROLLUP_TABLE} (day, repo, commits, first_timestamp, last_timestamp) '
+        f'VALUES (substr(NEW.timestamp, 1, 10), NEW.repo, 1, '
+        f'{_utc("NEW.timestamp")}, {_utc("NEW.timestamp")}) '
+        f'ON CONFLICT (day, repo) DO UPDATE SET commits = commits + 1, '
+        f'first_timestamp = min(first_timestamp, excluded.first_timestamp), '
+        f'last_timestamp = max(last_timestamp, excluded.last_timestamp); '
+        f'END'
+    )
+    current = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)
+    ).fetchone()
+    with conn:
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (day TEXT NOT NULL, repo TEXT NOT NULL, '
+            'commits INTEGER NOT NULL, first_timestamp TEXT, last_timestamp TEXT, '
+            'PRIMARY KEY (day, repo))'
+        )
+        if current is None or current[0] != trigger_sql:
+            if current:
+                # Rows written by an older trigger (local timestamps) are rebuilt.
+                conn.execute(f'DROP TRIGGER {trigger}')
+                rebuild = True
+            conn.execute(trigger_sql)
+        if rebuild:
+            conn.execute(f'DELETE FROM {ROLLUP_TABLE}')
+        if rebuild or not exists:
+            conn.execute(
+                f'INSERT INTO {ROLLUP_TABLE} (day, repo, commits, first_timestamp, last_timestamp) '
+                f'SELECT substr(timestamp, 1, 10), repo, count(*), '
+                f'min({_utc("timestamp")}), max({_utc("timestamp")}) '
+                'FROM commits GROUP BY 1, 2'
+            )
+
+
 def ensure_db(db_path: Path):
     conn = sqlite3.connect(db_path)
     conn.execute(
         'CREATE TABLE IF NOT EXISTS commits (repo TEXT, hash TEXT, timestamp TEXT, message TEXT, '
         'PRIMARY KEY (repo, hash))'
     )
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(commits)')}
+    for name, sql_type in DETAIL_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE commits ADD COLUMN {name} {sql_type}')
+    # Last commit stored by the backfill of each repository; everything it
+    # can reach has been stored too.
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS backfill (repo TEXT PRIMARY KEY, last_hash TEXT, '
+        'commits INTEGER, updated_at TEXT)'
+    )
+    # Before the rollups are seeded, which would count both copies.
+    ensure_rollups(conn, rebuild=fix_hash_newlines(conn))
     return conn
 
 
-def main():
+def log_commits(conn, repos, since: datetime, names: dict) -> int:
+    """Collect commits from ``repos`` and insert them in one transaction.
+
+    ``names`` caches repo_identifier results between calls.  Returns the
+    number of commits collected.
+    """
+    batch = []
+    for repo in repos:
+        try:
+            commits = collect_commits(repo, since)
+            if not commits:
+                continue
+            if repo not in names:
+                names[repo] = repo_identifier(repo)
+        except OSError as e:
+            # The repository was deleted or moved since it was discovered.
+            print(f'Skipping {repo}: {e}', file=sys.stderr)
+            continue
+        repo_name = names[repo]
+        batch.extend((repo_name, h, ts, msg) for h, ts, msg in commits)
+        print(f'Logged {len(commits)} commits from {repo_name}')
+    if batch:
+        with conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO commits (repo, hash, timestamp, message) VALUES (?, ?, ?, ?)',
+                batch
+            )
+    return len(batch)
+
+
+def _store_history(conn, repo_name: str, batch) -> None:
+    columns = ['repo', 'hash', 'timestamp', 'message', *DETAIL_COLUMNS]
+    updates = ', '.join(f'{name} = excluded.{name}' for name in DETAIL_COLUMNS)
+    with conn:
+        conn.executemany(
+            f'INSERT INTO commits ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))}) '
+            f'ON CONFLICT (repo, hash) DO UPDATE SET {updates}',
+            ((repo_name, *commit) for commit in batch)
+        )
+        conn.execute(
+            'INSERT INTO backfill (repo, last_hash, commits, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (repo) DO UPDATE SET last_hash = excluded.last_hash, '
+            'commits = commits + excluded.commits, updated_at = excluded.updated_at',
+            (repo_name, batch[-1][0], len(batch), datetime.now().isoformat(timespec='seconds'))
+        )
+
+
+def backfill_repo(conn, repo: Path, repo_name: str, batch_size: int = BACKFILL_BATCH) -> int:
+    """Store the full history of ``repo`` with authors and diffstats.
+
+    Commits are streamed oldest first (parents before children) and stored
+    in batches, each committed together with a checkpoint.  A later run,
+    whether the previous one was interrupted or completed, continues from
+    the checkpoint and only lists commits it cannot reach.  If the
+    checkpoint is no longer on HEAD (rewritten history) the whole history is
+    listed again; commits already stored are updated in place.  Returns the
+    number of commits stored.
+    """
+    row = conn.execute('SELECT last_hash FROM backfill WHERE repo = ?', (repo_name,)).fetchone()
+    since_hash = row[0] if row else None
+    if since_hash and not is_ancestor(repo, since_hash):
+        print(f'{repo_name}: checkpoint {since_hash[:8]} is not on HEAD, rescanning')
+        since_hash = None
+    stored = 0
+    batch = []
+    for commit in iter_history(repo, since_hash):
+        batch.append(commit)
+        if len(batch) >= batch_size:
+            _store_history(conn, repo_name, batch)
+            stored += len(batch)
+            batch = []
+    if batch:
+        _store_history(conn, repo_name, batch)
+        stored += len(batch)
+    return stored
+
+
+def backfill(conn, repos, names: dict) -> int:
+    """Backfill the full history of every repository in ``repos``."""
+    total = 0
+    for repo in repos:
+        if repo not in names:
+            names[repo] = repo_identifier(repo)
+        stored = backfill_repo(conn, repo, names[repo])
+        print(f'Backfilled {stored} commits from {names[repo]}')
+        total += stored
+    return total
+
+
+def discover_repos(directories):
+    """Return the set of git repositories under all ``directories``."""
+    repos = set()
+    for directory in directories:
+        base = Path(directory).expanduser()
+        repos.update(find_git_repos(base))
+    return repos
+
+
+def watch(conn, directories, days: int, settle: float, rescan: float, poll_interval: float):
+    """Log commits whenever a branch moves in any repository under ``directories``.
+
+    Runs until interrupted.  Only repositories whose refs changed are
+    queried; the directories are re-scanned for new and removed
+    repositories every ``rescan`` seconds.
+    """
+    from ref_watcher import git_dir, make_watcher
+
+    names = {}
+
+    def forget(repos):
+        for repo in repos:
+            watcher.remove_repo(repo)
+            names.pop(repo, None)
+        if repos:
+            print(f'Stopped watching {len(repos)} removed repositories')
+
+    with make_watcher(poll_interval) as watcher:
+        next_rescan = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_rescan:
+                found = discover_repos(directories)
+                forget(watcher.repos - found)
+                new_repos = found - watcher.repos
+                for repo in new_repos:
+                    watcher.add_repo(repo)
+                if new_repos:
+                    print(f'Watching {len(watcher.repos)} repositories')
+                    # Catch up on anything committed before the watch started.
+                    log_commits(conn, sorted(new_repos), datetime.now() - timedelta(days=days), names)
+                next_rescan = now + rescan
+            changed = watcher.wait(timeout=max(0.0, next_rescan - time.monotonic()), settle=settle)
+            gone = {repo for repo in changed if not git_dir(repo).is_dir()}
+            forget(gone)
+            changed -= gone
+            if changed:
+                since = datetime.now() - timedelta(days=days)
+                log_commits(conn, sorted(changed), since, names)
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Collect recent git commits into SQLite DB.')
     parser.add_argument('directories', nargs='*', default=['~/devel'], help='Directories to scan')
     parser.add_argument('--db', default='git_commits.sqlite', help='SQLite database file')
     parser.add_argument('--days', type=int, default=14, help='How many days back to scan')
-    args = parser.parse_args()
+    parser.add_argument('--backfill', action='store_true',
+                        help='Store the full history with authors and diffstats '
+                             '(resumes from the last run; ignores --days)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and log commits as soon as branch refs change')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='Seconds to wait for further ref changes before logging (watch mode)')
+    parser.add_argument('--rescan', type=float, default=3600.0,
+                        help='Seconds between scans for new repositories (watch mode)')
+    parser.add_argument('--poll-interval', type=float, default=30.0,
+                        help='Polling interval when inotify is unavailable (watch mode)')
+    args = parser.parse_args(argv)
 
-    since = datetime.now() - timedelta(days=args.days)
     db_path = Path(args.db)
     conn = ensure_db(db_path)
 
-    for directory in args.directories:
-        base = Path(directory).expanduser()
-        for repo in find_git_repos(base):
-            commits = collect_commits(repo, since)
-            if not commits:
-                continue
-            repo_name = repo_identifier(repo)
-            with conn:
-                conn.executemany(
-                    'INSERT OR IGNORE INTO commits (repo, hash, timestamp, message) VALUES (?, ?, ?, ?)',
-                    ((repo_name, h, ts, msg) for h, ts, msg in commits)
-                )
-            print(f'Logged {len(commits)} commits from {repo_name}')
+    if args.backfill:
+        try:
+            backfill(conn, sorted(discover_repos(args.directories)), {})
+        except KeyboardInterrupt:
+            print('Interrupted; run again to resume')
+        return
+
+    if args.watch:
+        try:
+            watch(conn, args.directories, args.days, args.settle, args.rescan, args.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    since = datetime.now() - timedelta(days=args.days)
+    log_commits(conn, sorted(discover_repos(args.directories)), since, {})
 
 
 if __name__ == '__main__':
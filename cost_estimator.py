@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 """Simple cost estimator for repository LOC data.
 
-This script reads `first_day_analysis.csv` and recalculates the
-`cost_estimate` column using a lightweight COCOMO-like formula.
-It does not require any external dependencies.
+This script recalculates the `cost_estimate` column of the results store
+(`first_day_analysis.sqlite`) and of `first_day_analysis.csv` using a
+lightweight COCOMO-like formula.  When a per-language SLOC breakdown is
+available the language factor is weighted by each language's share of the
+code.  It does not require any external dependencies.
 """
 
+import argparse
 import csv
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
+
+import languages as lang_table
+import results_store
 
 # Language productivity multipliers. Values < 1 reduce cost, > 1 increase cost.
 LANGUAGE_FACTOR: Dict[str, float] = {
@@ -25,15 +31,34 @@ PM_B = 1.05  # exponent
 PERSON_MONTH_COST = 56286  # dollars per person-month
 
 
-def estimate_cost(lines: int, language: str) -> float:
-    """Return a cost estimate for the given LOC and language."""
+def language_factor(language: str, breakdown: Optional[Dict[str, int]] = None) -> float:
+    """Return the productivity factor, SLOC-weighted over ``breakdown`` if given."""
+    sloc = sum(breakdown.values()) if breakdown else 0
+    if sloc <= 0:
+        return LANGUAGE_FACTOR.get(lang_table.canonical(language), 1.0)
+    return sum(
+        LANGUAGE_FACTOR.get(lang, 1.0) * lines for lang, lines in breakdown.items()
+    ) / sloc
+
+
+def estimate_cost(lines: int, language: str, breakdown: Optional[Dict[str, int]] = None) -> float:
+    """Return a cost estimate for the given LOC and language (or language mix)."""
     if lines <= 0:
         return 0.0
     ksloc = lines / 1000.0
     person_months = PM_A * (ksloc ** PM_B)
     base_cost = person_months * PERSON_MONTH_COST
-    factor = LANGUAGE_FACTOR.get(language.lower(), 1.0)
-    return base_cost * factor
+    return base_cost * language_factor(language, breakdown)
+
+
+def apply_costs(rows) -> None:
+    """Recompute ``cost_estimate`` in place for result rows held in memory."""
+    for row in rows:
+        lines = row.get("total_lines")
+        row["cost_estimate"] = (
+            None if lines is None
+            else round(estimate_cost(lines, row.get("language") or "", row.get("languages")), 2)
+        )
 
 
 def update_csv(path: Path) -> None:
@@ -49,8 +74,12 @@ def update_csv(path: Path) -> None:
         except ValueError:
             row["cost_estimate"] = ""
             continue
-        language = row.get("language", "")
-        cost = estimate_cost(lines, language)
+        language = row.get("language") or ""
+        try:
+            breakdown = lang_table.parse_breakdown(row.get("languages") or "")
+        except ValueError:
+            breakdown = None
+        cost = estimate_cost(lines, language, breakdown)
         row["cost_estimate"] = f"{cost:.2f}"
 
     with path.open("w", newline="") as f:
@@ -59,5 +88,47 @@ def update_csv(path: Path) -> None:
         writer.writerows(rows)
 
 
+def update_store(path: Path) -> None:
+    """Recompute cost estimates in the results store in place."""
+    rows = [
+        (row["repo"], row["first_commit"], row["total_lines"], row["language"], row["languages"])
+        for row in results_store.iter_results(
+            path, columns=["repo", "first_commit", "total_lines", "language", "languages"]
+        )
+    ]
+    conn = results_store.connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                f"UPDATE {results_store.TABLE} SET cost_estimate = ? "
+                "WHERE repo = ? AND first_commit = ?",
+                (
+                    (
+                        None if lines is None
+                        else round(estimate_cost(lines, language or "", breakdown), 2),
+                        repo,
+                        first_commit,
+                    )
+                    for repo, first_commit, lines, language, breakdown in rows
+                ),
+            )
+    finally:
+        conn.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Recompute cost estimates of the first-day results")
+    parser.add_argument("--store", default=results_store.DEFAULT_STORE,
+                        help=f"Results store to update if it exists (default: {results_store.DEFAULT_STORE})")
+    parser.add_argument("--csv", default=results_store.DEFAULT_CSV,
+                        help=f"CSV file to update (default: {results_store.DEFAULT_CSV})")
+    args = parser.parse_args(argv)
+
+    store = Path(args.store)
+    if store.exists():
+        update_store(store)
+    update_csv(Path(args.csv))
+
+
 if __name__ == "__main__":
-    update_csv(Path("first_day_analysis.csv"))
+    main()
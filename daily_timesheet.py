@@ -3,6 +3,15 @@ from datetime import datetime
 from pathlib import Path
 import argparse
 
+PERIODS = ('day', 'week', 'month')
+
+# SQL expressions mapping a rollup day (YYYY-MM-DD) to the start of its period.
+_PERIOD_SQL = {
+    'day': 'day',
+    'week': "date(day, '-6 days', 'weekday 1')",
+    'month': "substr(day, 1, 7)",
+}
+
 
 def load_commits(db_path: Path):
     conn = sqlite3.connect(db_path)
@@ -20,10 +29,69 @@ def group_by_day(commits):
     return day_map
 
 
-def main():
+def load_summary(db_path: Path, period: str = 'day', since: str = None):
+    """Return (period, repo, commits, first timestamp, last timestamp) rows.
+
+    Reads only the ``daily_commits`` rollup maintained by commit_logger, so
+    the cost depends on the number of repository-days, not on the number of
+    commits.  Weeks start on Monday and are labelled by that date.  Days
+    are the committers' local dates; the first and last timestamps are UTC.
+    """
+    import commit_logger
+
+    conn = commit_logger.ensure_db(db_path)
+    try:
+        sql = (
+            f'SELECT {_PERIOD_SQL[period]} AS period, repo, sum(commits), '
+            f'min(first_timestamp), max(last_timestamp) FROM {commit_logger.ROLLUP_TABLE}'
+        )
+        params = []
+        if since:
+            sql += ' WHERE day >= ?'
+            params.append(since)
+        sql += ' GROUP BY period, repo ORDER BY period, repo'
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def print_summary(rows):
+    current = None
+    for period, repo, commits, first, last in rows:
+        if period != current:
+            if current is not None:
+                print()
+            print(period)
+            current = period
+        span = f'{first[:16]} - {last[:16]}'.replace('T', ' ')
+        print(f'  {repo} - {commits} commit{"s" if commits != 1 else ""} ({span} UTC)')
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description='Print timesheet from commit log DB.')
     parser.add_argument('--db', default='git_commits.sqlite', help='Database file')
-    args = parser.parse_args()
+    parser.add_argument('--summary', action='store_true',
+                        help='Print commit counts per repository from the rollup table')
+    parser.add_argument('--period', choices=PERIODS, default='day',
+                        help='Summary period (default: day)')
+    parser.add_argument('--since', help='Only summarize days on or after YYYY-MM-DD')
+    args = parser.parse_args(argv)
+    if args.since:
+        try:
+            datetime.strptime(args.since, '%Y-%m-%d')
+        except ValueError:
+            parser.error(f'invalid --since date {args.since!r}, expected YYYY-MM-DD')
+
+    if args.summary:
+        if not Path(args.db).exists():
+            print('No commits found.')
+            return
+        rows = load_summary(Path(args.db), args.period, args.since)
+        if not rows:
+            print('No commits found.')
+            return
+        print_summary(rows)
+        return
 
     commits = list(load_commits(Path(args.db)))
     if not commits:
@@ -0,0 +1,230 @@
+"""Cross-repository duplicate code detection for the first-day scan.
+
+While a repository is being counted, ``fingerprint_tree`` reduces each
+source file to 64-bit hashes: one for the git blob and one per non-blank
+line for the shingle of ``SHINGLE_LINES`` consecutive lines starting at that
+line.  All hashes live in numpy ``uint64`` arrays, never as per-line Python
+objects.  ``DuplicateIndex`` then decides, repository by repository in
+chronological order, how many lines were not seen in any earlier repository.
+"""
+
+import io
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+import languages
+
+SHINGLE_LINES = 3
+
+# Files larger than this are almost always generated or vendored data.
+MAX_FILE_BYTES = 1 << 20
+
+_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+class Fingerprint:
+    """Blob and line-shingle hashes for one repository snapshot."""
+
+    __slots__ = ("blob_ids", "blob_lines", "shingles")
+
+    def __init__(self, blob_ids, blob_lines, shingles):
+        self.blob_ids = blob_ids        # uint64, one per source file
+        self.blob_lines = blob_lines    # int64, non-blank lines per file
+        self.shingles = shingles        # uint64, one per non-blank line
+
+    @property
+    def total_lines(self) -> int:
+        return len(self.shingles)
+
+
+def _line_hashes(data: bytes) -> np.ndarray:
+    # Lines are hashed as they are read, without a list of them in between.
+    # Treating \r as a line end too keeps bytes.splitlines() boundaries.
+    lines = (line.strip() for line in io.BytesIO(data.replace(b"\r", b"\n")))
+    return np.fromiter(
+        ((zlib.crc32(line) << 32) | zlib.adler32(line) for line in lines if line),
+        dtype=np.uint64,
+    )
+
+
+def line_shingles(hashes: np.ndarray, k: int = SHINGLE_LINES) -> np.ndarray:
+    """Return one shingle hash per line.
+
+    Line i gets the polynomial hash of lines i .. i+k-1; the last k-1 lines
+    reuse the final full window, and files shorter than k lines hash all
+    their lines as a single window.
+    """
+    n = len(hashes)
+    if n == 0:
+        return hashes
+    if n < k:
+        hashes = np.concatenate([hashes, np.zeros(k - n, dtype=np.uint64)])
+    windows = np.zeros(len(hashes) - k + 1, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(k):
+            windows = windows * _MULTIPLIER + hashes[offset:offset + len(windows)]
+    starts = np.minimum(np.arange(n), len(windows) - 1)
+    return windows[starts]
+
+
+def _blob_id(sha: str) -> int:
+    return int(sha[:16], 16)
+
+
+def fingerprint_tree(root: Path, blobs) -> Fingerprint:
+    """Fingerprint the source files of an extracted tree.
+
+    ``blobs`` is an iterable of (blob SHA, path relative to ``root``) pairs
+    as listed by ``git ls-tree -r``.
+    """
+    blob_ids = []
+    blob_lines = []
+    shingles = []
+    for sha, rel_path in blobs:
+        path = Path(root) / rel_path
+        if languages.classify(path) is None:
+            continue
+        try:
+            if path.stat().st_size > MAX_FILE_BYTES:
+                continue
+            data = path.read_bytes()
+        except OSError:
+            continue
+        if b"\0" in data[:8192]:
+            continue
+        file_shingles = line_shingles(_line_hashes(data))
+        blob_ids.append(_blob_id(sha))
+        blob_lines.append(len(file_shingles))
+        shingles.append(file_shingles)
+    return Fingerprint(
+        np.array(blob_ids, dtype=np.uint64),
+        np.array(blob_lines, dtype=np.int64),
+        np.concatenate(shingles) if shingles else np.zeros(0, dtype=np.uint64),
+    )
+
+
+def fingerprint_path(results_path) -> Path:
+    """Return the fingerprint file kept next to a results store or CSV."""
+    path = Path(results_path)
+    return path.with_name(f"{path.stem}.fingerprints.npz")
+
+
+def save_fingerprints(path, entries) -> None:
+    """Save (repo, first_commit, Fingerprint) entries to an ``.npz`` file."""
+    entries = list(entries)
+    fps = [fp for _, _, fp in entries]
+
+    def concat(arrays, dtype):
+        return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+
+    np.savez(
+        path,
+        repos=np.array([repo for repo, _, _ in entries], dtype=str),
+        first_commits=np.array([commit for _, commit, _ in entries], dtype=str),
+        blob_counts=np.array([len(fp.blob_ids) for fp in fps], dtype=np.int64),
+        line_counts=np.array([len(fp.shingles) for fp in fps], dtype=np.int64),
+        blob_ids=concat([fp.blob_ids for fp in fps], np.uint64),
+        blob_lines=concat([fp.blob_lines for fp in fps], np.int64),
+        shingles=concat([fp.shingles for fp in fps], np.uint64),
+    )
+
+
+def load_fingerprints(path) -> dict:
+    """Return {(repo, first_commit): Fingerprint} from ``save_fingerprints`` output."""
+    with np.load(path) as data:
+        blob_splits = np.cumsum(data["blob_counts"])[:-1]
+        line_splits = np.cumsum(data["line_counts"])[:-1]
+        keys = zip(data["repos"].tolist(), data["first_commits"].tolist())
+        fps = zip(np.split(data["blob_ids"], blob_splits),
+                  np.split(data["blob_lines"], blob_splits),
+                  np.split(data["shingles"], line_splits))
+        return {key: Fingerprint(*arrays) for key, arrays in zip(keys, fps)}
+
+
+def _merge_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Merge two sorted unique arrays into one sorted unique array."""
+    merged = np.concatenate([a, b])
+    # Timsort detects the two sorted runs, so this is a linear merge.
+    merged.sort(kind="stable")
+    keep = np.empty(len(merged), dtype=bool)
+    keep[0] = True
+    np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+    return merged[keep]
+
+
+class _SortedRuns:
+    """Set of uint64 values stored as sorted numpy runs.
+
+    New values are appended as a sorted run and runs of similar size are
+    merged, so there are O(log n) runs and each membership test is a
+    vectorized binary search per run.
+    """
+
+    def __init__(self):
+        self._runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def contains(self, values: np.ndarray) -> np.ndarray:
+        if not self._runs or len(values) == 0:
+            return np.zeros(len(values), dtype=bool)
+        # Binary searches with sorted needles walk each run in order.
+        order = np.argsort(values, kind="stable")
+        needles = values[order]
+        found_sorted = np.zeros(len(values), dtype=bool)
+        for run in self._runs:
+            pos = np.searchsorted(run, needles)
+            pos[pos == len(run)] = len(run) - 1
+            found_sorted |= run[pos] == needles
+        found = np.empty(len(values), dtype=bool)
+        found[order] = found_sorted
+        return found
+
+    def add(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self._runs.append(np.unique(values))
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            last = self._runs.pop()
+            self._runs[-1] = _merge_sorted(self._runs[-1], last)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(run.nbytes for run in self._runs)
+
+
+class DuplicateIndex:
+    """Blobs and line shingles seen in the repositories added so far."""
+
+    def __init__(self):
+        self._blobs = _SortedRuns()
+        self._shingles = _SortedRuns()
+
+    def add(self, fp: Fingerprint) -> int:
+        """Return the number of lines of ``fp`` not seen before, then index it.
+
+        Lines of a blob already seen elsewhere are duplicates without looking
+        at their shingles; other lines are duplicates if their shingle was
+        seen.  Copies within the same repository still count as novel.
+        """
+        seen_blob = np.repeat(self._blobs.contains(fp.blob_ids), fp.blob_lines)
+        seen_line = seen_blob | self._shingles.contains(fp.shingles)
+        novel = int(len(seen_line) - np.count_nonzero(seen_line))
+        self._blobs.add(fp.blob_ids)
+        self._shingles.add(fp.shingles)
+        return novel
+
+    @property
+    def nbytes(self) -> int:
+        return self._blobs.nbytes + self._shingles.nbytes
+
+
+def novel_sloc(total_lines: int, fp: Fingerprint, novel_lines: int) -> int:
+    """Scale the SLOC count by the share of fingerprinted lines that are novel."""
+    if fp.total_lines == 0:
+        # Nothing we could fingerprint, so nothing is known to be copied.
+        return total_lines
+    return round(total_lines * novel_lines / fp.total_lines)
@@ -1,21 +1,44 @@
 #!/usr/bin/env python
 
+import io
 import os
 import subprocess
-import tempfile
-import shutil
-import csv
 import re
-from datetime import datetime, timedelta
+import sys
+import tarfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import urlparse
 import argparse
 
+import commit_logger
+import languages
+import results_store
+import scratch
+
 
 class FirstDayAnalysisError(Exception):
     """Custom exception for analysis errors"""
     pass
 
 
+def repo_owner(repo_path):
+    """Return the user or organisation owning a repository's origin remote, or None"""
+    identifier = commit_logger.repo_identifier(repo_path)
+    if identifier == str(repo_path):
+        return None  # no origin remote
+    if '://' in identifier:
+        path = urlparse(identifier).path
+    else:
+        # "owner/repo" (GitHub) or scp-like "git@host:owner/repo.git"
+        path = identifier.split(':', 1)[-1]
+    parts = [part for part in path.removesuffix('.git').split('/') if part]
+    # The top-level namespace owns nested groups such as "org/team/repo"
+    return parts[0] if len(parts) >= 2 else None
+
+
 def find_git_repos(base_dir):
     """Find all git repositories in the base directory"""
     repos = []
@@ -171,20 +194,13 @@ def extract_repo_at_commit(repo_path, commit_hash, extract_dir):
         if tar_process.returncode != 0:
             print(f"  DEBUG: Tar extraction error (code {tar_process.returncode}): {tar_process.stderr}")
             
-            # Try alternative approach - save to file first
+            # Try alternative approach - unpack the archive from memory, so no
+            # copy of the tar takes up scratch space next to the extracted files
             print(f"  DEBUG: Trying alternative extraction approach")
-            tar_path = target_dir / f"{repo_name}.tar"
-            with open(tar_path, 'wb') as f:
-                f.write(archive_process.stdout)
-            
-            subprocess.run(
-                ['tar', '-xf', str(tar_path), '-C', str(target_dir)],
-                capture_output=True,
-                check=True
-            )
-            
-            # Remove tar file after extraction
-            tar_path.unlink()
+            with tarfile.open(fileobj=io.BytesIO(archive_process.stdout)) as archive:
+                # The 'data' filter only exists from Python 3.11.4 on
+                options = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+                archive.extractall(target_dir, **options)
         
         # Check if anything was extracted
         files = list(target_dir.glob('**/*'))
@@ -226,10 +242,15 @@ def run_sloccount(directory):
         if len(list(Path(directory).glob('**/*'))) > 20:
             print(f"    ... and more files (showing first 20 only)")
         
-        # Count files of different types for debugging
-        source_extensions = ['.py', '.js', '.java', '.c', '.cpp', '.h', '.hpp', '.cs', '.go', '.rs', '.ts', '.rb', '.php']
-        source_files = sum(1 for ext in source_extensions for _ in Path(directory).glob(f'**/*{ext}'))
-        print(f"  DEBUG: Found {source_files} potential source files")
+        # Count files of different types for debugging (one walk, classified)
+        file_languages = {}
+        for root, _, files in os.walk(directory):
+            for name in files:
+                language = languages.classify(os.path.join(root, name))
+                if language:
+                    file_languages[language] = file_languages.get(language, 0) + 1
+        source_files = sum(file_languages.values())
+        print(f"  DEBUG: Found {source_files} potential source files {file_languages}")
         
         # Try running find command to verify directory is accessible
         try:
@@ -262,13 +283,18 @@ def run_sloccount(directory):
         # Alternative approach: Sum up the lines directly from sloccount output
         total_lines = 0
         cost_estimate = 0.0
+        sloc_by_language = {}
         
-        # Extract individual file results directly from the detailed output
-        file_results = re.findall(r'^(\d+)\s+\w+\s+\w+\s+', output, re.MULTILINE)
+        # Extract individual file results directly from the detailed output:
+        # "<sloc> <language> <module> <path>"
+        file_results = re.findall(r'^(\d+)\s+(\w+)\s+\w+\s+(.*)$', output, re.MULTILINE)
         if file_results:
             print(f"  DEBUG: Found {len(file_results)} files with line counts in sloccount output")
-            for count in file_results:
+            for count, sloc_language, file_path in file_results:
                 total_lines += int(count)
+                # sloccount's own language wins; the classifier only fills gaps.
+                language = languages.canonical(sloc_language) or languages.classify(file_path.strip())
+                sloc_by_language[language] = sloc_by_language.get(language, 0) + int(count)
             print(f"  DEBUG: Calculated total lines by summing individual files: {total_lines}")
             
             # Estimate cost using COCOMO model (similar to how sloccount does it)
@@ -296,7 +322,7 @@ def run_sloccount(directory):
         if total_lines == 0 and source_files > 0:
             print(f"  DEBUG: WARNING: Found {source_files} source files but calculated 0 lines of code")
             
-        return total_lines, cost_estimate
+        return total_lines, cost_estimate, sloc_by_language
         
     except subprocess.CalledProcessError as e:
         print(f"  DEBUG: sloccount failed with error: {e}")
@@ -306,10 +332,38 @@ def run_sloccount(directory):
         raise FirstDayAnalysisError("sloccount not found - please install it (apt install sloccount)")
 
 
-def analyze_repository(repo_path, extract_base_dir):
-    """Analyze a single repository and return results"""
+def list_tree(repo_path, commit_hash):
+    """Return (blob SHA, path, size) triples for every file in a commit"""
+    result = subprocess.run(
+        ['git', 'ls-tree', '-r', '-l', '-z', commit_hash],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    entries = []
+    for record in result.stdout.split('\0'):
+        if not record:
+            continue
+        info, path = record.split('\t', 1)
+        _mode, obj_type, sha, size = info.split()
+        if obj_type == 'blob':
+            entries.append((sha, path, int(size)))
+    return entries
+
+
+def analyze_repository(repo_path, workspace, fingerprint=False):
+    """Analyze a single repository and return results
+
+    The repository is extracted into a directory reserved from
+    ``workspace`` (a ``scratch.Scratch``), which is deleted again before
+    returning.  With ``fingerprint`` set, the result also carries a
+    ``fingerprint`` entry (see dedup.py) used to work out how many lines are
+    novel.
+    """
     print(f"Analyzing {repo_path.name}...")
     
+    extract_base_dir = None
     try:
         # Get first commit info
         first_commit_hash, first_commit_time = get_first_commit_info(repo_path)
@@ -320,30 +374,35 @@ def analyze_repository(repo_path, extract_base_dir):
         print(f"  Last commit in first 24h: {last_commit_hash[:8]}")
         
         # Try a direct check of what files exist at that commit
+        tree_entries = []
         try:
-            files_at_commit = subprocess.run(
-                ['git', 'ls-tree', '-r', '--name-only', last_commit_hash],
-                cwd=repo_path,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            file_count = len(files_at_commit.stdout.strip().split('\n')) if files_at_commit.stdout.strip() else 0
+            tree_entries = list_tree(repo_path, last_commit_hash)
+            file_count = len(tree_entries)
             print(f"  DEBUG: Found {file_count} files at commit {last_commit_hash[:8]}")
             if file_count == 0:
                 print(f"  DEBUG: No files found in commit. This might be an empty commit.")
                 return {
                     'repo': repo_path.name,
+                    'owner': repo_owner(repo_path),
                     'date': first_commit_time.strftime('%Y-%m-%d'),
                     'first_commit': first_commit_hash,
                     'analysis_commit': last_commit_hash,
                     'total_lines': 0,
-                    'cost_estimate': 0.0
+                    'cost_estimate': 0.0,
+                    'languages': {},
+                    'novel_lines': 0
                 }
         except subprocess.CalledProcessError:
             print(f"  DEBUG: Failed to get file list at commit")
         
-        # Extract repository at that commit
+        # Reserve scratch space (waits while the budget is exhausted), then
+        # extract repository at that commit.  Without a file list the size is
+        # unknown, so the extraction gets the whole budget to itself.
+        if tree_entries:
+            reservation = scratch.disk_bytes(size for _, _, size in tree_entries)
+        else:
+            reservation = workspace.budget
+        extract_base_dir = workspace.acquire(f"{repo_path.name}_{last_commit_hash[:8]}", reservation)
         extracted_dir = extract_repo_at_commit(repo_path, last_commit_hash, extract_base_dir)
         print(f"  Extracted to: {extracted_dir}")
         
@@ -355,7 +414,7 @@ def analyze_repository(repo_path, extract_base_dir):
             
             # Alternative approach: Use git show to check out each file directly
             try:
-                files_to_checkout = files_at_commit.stdout.strip().split('\n') if files_at_commit.stdout.strip() else []
+                files_to_checkout = [path for _, path, _ in tree_entries]
                 for file_path in files_to_checkout[:20]:  # Limit to first 20 files for debugging
                     if not file_path.strip():
                         continue
@@ -383,21 +442,56 @@ def analyze_repository(repo_path, extract_base_dir):
                 print(f"  DEBUG: Alternative extraction failed: {e}")
         
         # Run sloccount
-        total_lines, cost_estimate = run_sloccount(extracted_dir)
+        total_lines, cost_estimate, sloc_by_language = run_sloccount(extracted_dir)
         print(f"  Results: {total_lines} lines, ${cost_estimate:,.2f}")
+        if sloc_by_language:
+            print(f"  Languages: {languages.format_breakdown(sloc_by_language)}")
         
-        return {
+        result = {
             'repo': repo_path.name,
+            'owner': repo_owner(repo_path),
             'date': first_commit_time.strftime('%Y-%m-%d'),
             'first_commit': first_commit_hash,
             'analysis_commit': last_commit_hash,
             'total_lines': total_lines,
-            'cost_estimate': cost_estimate
+            'cost_estimate': cost_estimate,
+            'language': languages.dominant(sloc_by_language),
+            'languages': sloc_by_language
         }
+        if fingerprint:
+            import dedup
+            result['fingerprint'] = dedup.fingerprint_tree(
+                extracted_dir, [(sha, path) for sha, path, _ in tree_entries]
+            )
+            print(f"  DEBUG: Fingerprinted {result['fingerprint'].total_lines} source lines")
+        return result
         
     except FirstDayAnalysisError as e:
         print(f"  ERROR: {e}")
         return None
+    finally:
+        if extract_base_dir is not None:
+            workspace.release(extract_base_dir)
+
+
+def resolve_novel_lines(results):
+    """Fill in ``novel_lines`` for fingerprinted results.
+
+    Repositories are indexed in order of their first commit, so a line only
+    counts as novel if no earlier repository contained it.
+    """
+    import dedup
+
+    index = dedup.DuplicateIndex()
+    for result in sorted(results, key=lambda r: (r['date'], r['repo'])):
+        fp = result.pop('fingerprint', None)
+        if fp is None:
+            continue
+        novel = index.add(fp)
+        result['novel_lines'] = dedup.novel_sloc(result['total_lines'], fp, novel)
+        print(f"  {result['repo']}: {novel}/{fp.total_lines} fingerprinted lines novel, "
+              f"{result['novel_lines']} novel SLOC")
+    print(f"Duplicate index: {index.nbytes / 1e6:.1f} MB")
 
 
 def load_skiplist(skiplist_path=None):
@@ -423,8 +517,119 @@ def load_skiplist(skiplist_path=None):
         return default_skiplist
 
 
-def main(argv=None):
-    """Main analysis function"""
+def parse_shard(text):
+    """Parse an ``i/N`` shard specification (1 <= i <= N)."""
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard {text!r}, expected i/N")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard {text!r}, need 1 <= i <= N")
+    return index, count
+
+
+def parse_size(text):
+    """Parse a byte count such as ``512M`` or ``2G``."""
+    try:
+        return scratch.parse_size(text)
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}, expected e.g. 512M or 2G")
+
+
+def shard_repos(repos, index, count):
+    """Return the repositories belonging to shard ``index`` of ``count``.
+
+    Repositories are assigned by a CRC32 of their name, so every worker
+    computes the same split without coordinating.
+    """
+    return [repo for repo in repos
+            if zlib.crc32(repo.name.encode('utf-8')) % count == index - 1]
+
+
+def _shard_path(path, index, count):
+    path = Path(path)
+    return path.with_name(f"{path.stem}.shard-{index}-of-{count}{path.suffix}")
+
+
+def resolve_merged_novel_lines(inputs, store_path):
+    """Recompute ``novel_lines`` of a merged store across all its inputs.
+
+    Each shard only detects code copied between its own repositories, so
+    the merge re-runs duplicate detection over the fingerprints saved next to
+    the inputs.  Without fingerprints for every input the shard-local values
+    are kept and a warning is printed.
+    """
+    rows = results_store.load_results(store_path)
+    if all(row['novel_lines'] is None for row in rows):
+        return  # sharded runs with --no-dedup
+    import dedup
+
+    missing = [str(path) for path in inputs if not dedup.fingerprint_path(path).exists()]
+    if missing:
+        print(f"WARNING: no fingerprints for {', '.join(missing)}; novel_lines only "
+              "accounts for code copied within each shard", file=sys.stderr)
+        return
+    # Take each fingerprint from the input whose row won the merge (newest
+    # analyzed_at, the first input on ties), so it matches the stored row.
+    winners = {}
+    for n, path in enumerate(inputs):
+        for row in results_store.iter_results(path, columns=['repo', 'first_commit', 'analyzed_at']):
+            key = (row['repo'], row['first_commit'])
+            analyzed_at = row['analyzed_at'] or ''
+            if key not in winners or analyzed_at > winners[key][0]:
+                winners[key] = (analyzed_at, n)
+    fingerprints = {}
+    for n, path in enumerate(inputs):
+        for key, fp in dedup.load_fingerprints(dedup.fingerprint_path(path)).items():
+            if winners.get(key, (None, n))[1] == n:
+                fingerprints[key] = fp
+    for row in rows:
+        fp = fingerprints.get((row['repo'], row['first_commit']))
+        if fp is not None:
+            row['fingerprint'] = fp
+    entries = [(r['repo'], r['first_commit'], r['fingerprint']) for r in rows if 'fingerprint' in r]
+    print("Detecting code copied between repositories of all shards...")
+    resolve_novel_lines(rows)
+    results_store.write_results(store_path, rows)
+    # Lets the merged store itself be merged again
+    dedup.save_fingerprints(dedup.fingerprint_path(store_path), entries)
+
+
+def merge_main(argv=None):
+    """Merge partial result files from sharded runs"""
+    parser = argparse.ArgumentParser(
+        prog="firstday.py merge",
+        description="Merge result files (stores or CSVs) from several firstday runs",
+    )
+    parser.add_argument("inputs", nargs="+", help="Partial result files to merge")
+    parser.add_argument(
+        "--store",
+        default=results_store.DEFAULT_STORE,
+        help=f"Merged results store (default: {results_store.DEFAULT_STORE})",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=results_store.DEFAULT_CSV,
+        help=f"CSV export of the merged results (default: {results_store.DEFAULT_CSV})",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        count = results_store.merge_results(args.inputs, args.store)
+    except results_store.ResultsStoreError as e:
+        raise SystemExit(f"ERROR: {e}")
+    resolve_merged_novel_lines(args.inputs, args.store)
+    results_store.export_csv(results_store.iter_results(args.store, order_by=["repo"]), args.output)
+    print(f"Merged {len(args.inputs)} files into {args.store}: {count} repositories (CSV export: {args.output})")
+
+
+def scan(argv=None):
+    """Analyze the repositories and return their results.
+
+    Returns None if the scan could not run and an empty list if no
+    repository could be analyzed; ``main`` turns both into exit status 1.
+    """
     parser = argparse.ArgumentParser(
         description="Analyze first day commits of git repositories"
     )
@@ -440,10 +645,51 @@ def main(argv=None):
         default="first_day_analysis.csv",
         help="Path for the output CSV file (default: first_day_analysis.csv)",
     )
+    parser.add_argument(
+        "--store",
+        default=results_store.DEFAULT_STORE,
+        help=f"Path for the typed results store (default: {results_store.DEFAULT_STORE})",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="i/N",
+        help="Only analyze shard i of N (1-based); output names get a .shard-i-of-N suffix. "
+             "Combine the partial results with 'firstday.py merge'",
+    )
+    parser.add_argument(
+        "--no-dedup",
+        action="store_true",
+        help="Skip cross-repository duplicate detection (novel_lines is left empty)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Repositories to analyze concurrently (default: 1)",
+    )
+    parser.add_argument(
+        "--scratch-dir",
+        help=f"Directory for extracted repositories (default: ${scratch.ENV_VAR}, "
+             "/dev/shm, then the system temporary directory)",
+    )
+    parser.add_argument(
+        "--scratch-budget",
+        type=parse_size,
+        help="Maximum bytes of extracted repositories at any time, e.g. 2G "
+             "(default: half the free space of the scratch directory)",
+    )
     args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     devel_dir = args.directory
     output_csv = Path(args.output)
+    store_path = Path(args.store)
+    if args.shard:
+        output_csv = _shard_path(output_csv, *args.shard)
+        store_path = _shard_path(store_path, *args.shard)
     
     # Configuration
     skiplist_path = Path.cwd() / 'skiplist.txt'
@@ -469,13 +715,15 @@ def main(argv=None):
         print(f"DEBUG: which sloccount result: {path_check.stdout or 'not found'}")
         return
     
-    # Create temporary directory for extractions
-    with tempfile.TemporaryDirectory(prefix='sloccount_analysis_') as temp_dir:
-        temp_path = Path(temp_dir)
-        extract_dir = temp_path / 'extracted_repos'
-        extract_dir.mkdir()
-        
-        print(f"Working directory: {temp_dir}")
+    # Scratch space for extractions; each one is deleted once counted
+    try:
+        workspace = scratch.Scratch(args.scratch_dir, args.scratch_budget)
+    except (scratch.ScratchError, OSError) as e:
+        print(f"ERROR: {e}")
+        return
+    with workspace:
+        print(f"Working directory: {workspace.root} "
+              f"(budget {scratch.format_size(workspace.budget)})")
         print(f"Looking for repositories in: {Path(devel_dir).expanduser()}")
         
         # Find all git repositories
@@ -486,38 +734,71 @@ def main(argv=None):
         repos = [repo for repo in all_repos if repo.name not in skiplist]
         print(f"Analyzing {len(repos)} repositories (skipped {len(all_repos) - len(repos)})")
         
+        if args.shard:
+            repos = shard_repos(repos, *args.shard)
+            print(f"Shard {args.shard[0]}/{args.shard[1]}: analyzing {len(repos)} of them")
+        
         if not repos:
             print("No git repositories to analyze after applying skiplist!")
             return
         
-        # Analyze each repository
-        results = []
-        for repo_path in repos:
-            result = analyze_repository(repo_path, extract_dir)
+        # Analyze each repository; workers block in workspace.acquire while
+        # the scratch budget is used up
+        def analyze(repo_path):
+            result = analyze_repository(repo_path, workspace, fingerprint=not args.no_dedup)
             if result:
-                results.append(result)
-        
-        # Write results to CSV
+                result['analyzed_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+            return result
+        
+        with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+            results = [result for result in pool.map(analyze, repos) if result]
+        print(f"Peak scratch reservation: {scratch.format_size(workspace.peak)}")
+        
+        if results and not args.no_dedup:
+            if args.shard:
+                # Kept so 'merge' can recompute novel_lines across all shards
+                import dedup
+                fp_path = dedup.fingerprint_path(store_path)
+                dedup.save_fingerprints(fp_path, [
+                    (r['repo'], r['first_commit'], r['fingerprint'])
+                    for r in results if 'fingerprint' in r
+                ])
+                print(f"Fingerprints saved to: {fp_path}")
+            print("\nDetecting code copied between repositories...")
+            resolve_novel_lines(results)
+        
+        # Write results to the store and export a CSV copy for compatibility
         if results:
+            store_path = store_path if store_path.is_absolute() else Path.cwd() / store_path
+            results_store.write_results(store_path, results)
             csv_path = output_csv if output_csv.is_absolute() else Path.cwd() / output_csv
-            with open(csv_path, 'w', newline='') as csvfile:
-                fieldnames = ['repo', 'date', 'first_commit', 'analysis_commit', 'total_lines', 'cost_estimate']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for result in results:
-                    writer.writerow(result)
+            results_store.export_csv(results, csv_path)
             
-            print(f"\nResults written to: {csv_path}")
+            print(f"\nResults written to: {store_path} (CSV export: {csv_path})")
             print(f"Successfully analyzed {len(results)} repositories")
             
             # Print summary
             total_lines = sum(r['total_lines'] for r in results)
             total_cost = sum(r['cost_estimate'] for r in results)
             print(f"Total first-day output: {total_lines:,} lines, ${total_cost:,.2f}")
+            if not args.no_dedup:
+                novel_lines = sum(r.get('novel_lines') or 0 for r in results)
+                print(f"Novel first-day output: {novel_lines:,} lines")
         else:
             print("No repositories could be analyzed successfully")
+        
+        # Returned for callers running further steps in-process (repometrics pipeline)
+        return results
+
+
+def main(argv=None):
+    """Main analysis function"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'merge':
+        return merge_main(argv[1:])
+    return 0 if scan(argv) else 1
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
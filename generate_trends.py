@@ -1,8 +1,49 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-from sklearn.linear_model import LinearRegression
+"""Plot the monthly maximum first-day cost and its exponential trend.
+
+Only numpy is imported at start-up.  matplotlib is imported lazily (with the
+non-interactive Agg backend) when charts are actually rendered, so the
+``--format text`` and ``--format json`` modes skip plotting entirely.
+"""
+
+import time
+
+_T0 = time.perf_counter()
+
+import argparse
+import json
+import sys
+from datetime import date, datetime, timedelta
+from math import sqrt
+
 import numpy as np
-from math import erf, sqrt
+
+import chart_cache
+import results_store
+
+_T_IMPORTS = time.perf_counter()
+
+START_DATE = date(2021, 1, 1)
+
+DEFAULT_RESAMPLES = 10000
+CONFIDENCE = 0.95
+
+# Rendering parameters; they are part of each chart's cache key, so bump
+# "version" when the drawing code changes in a way these values don't capture.
+COST_CHART = {
+    "version": 2,
+    "figsize": (10, 4),
+    "title": "Monthly Max First Day Cost Trend",
+}
+LOG_CHART = {
+    "version": 2,
+    "figsize": (10, 4),
+    "decades": (3, 7),
+    "extrapolate_to": 6,
+    "title": ("Cocomo II estimation of the cost to produce the code written after one day\n"
+              "(Grouped by most productive first-day repo in each month)"),
+}
+# Trends reaching the target decade later than this are not extrapolated.
+MAX_EXTRAPOLATION_YEARS = 100
 
 
 def _regression_stats(x: np.ndarray, y: np.ndarray) -> tuple:
@@ -26,98 +67,345 @@ def _regression_stats(x: np.ndarray, y: np.ndarray) -> tuple:
     se_intercept = se * sqrt(1.0 / n + x_mean ** 2 / ssx)
 
     def _p_value(t: float) -> float:
-        # Approximate two-sided p-value using the normal distribution.
-        return 2 * (1 - (1 + erf(abs(t) / sqrt(2))) / 2)
+        # Two-sided p-value from Student's t with n - 2 degrees of freedom.
+        if n <= 2:
+            return float('nan')
+        from scipy.special import stdtr
+        return float(2 * stdtr(n - 2, -abs(t)))
 
     t_slope = slope / se_slope if se_slope != 0 else float('inf')
     t_intercept = intercept / se_intercept if se_intercept != 0 else float('inf')
     return intercept, slope, _p_value(t_intercept), _p_value(t_slope)
 
 
-def main():
-    df = pd.read_csv("first_day_analysis.csv", parse_dates=["date"])
-    df.sort_values("date", inplace=True)
+def bootstrap_fit(x: np.ndarray, y: np.ndarray, n_resamples: int = DEFAULT_RESAMPLES,
+                  seed: int = 0) -> tuple:
+    """Return (intercepts, slopes) of ``n_resamples`` bootstrap refits.
 
-    # Consider data from 2021 onward only
-    df = df[df["date"] >= pd.Timestamp("2021-01-01")]
+    All resamples are drawn and fitted at once as an (n_resamples, n) index
+    matrix; resamples whose x values are all equal (undefined slope) are
+    dropped.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(x), size=(n_resamples, len(x)))
+    xb = x[idx]
+    yb = y[idx]
+    xb_mean = xb.mean(axis=1, keepdims=True)
+    yb_mean = yb.mean(axis=1, keepdims=True)
+    dx = xb - xb_mean
+    ssx = np.einsum("ij,ij->i", dx, dx)
+    sxy = np.einsum("ij,ij->i", dx, yb - yb_mean)
+    valid = ssx > 0
+    slopes = sxy[valid] / ssx[valid]
+    intercepts = yb_mean[valid, 0] - slopes * xb_mean[valid, 0]
+    return intercepts, slopes
 
-    if df.empty:
-        raise SystemExit("No data after 2021-01-01")
 
-    # Aggregate by month taking the maximum cost within each month
-    monthly = df.resample("ME", on="date").max()
-    monthly = monthly.dropna(subset=["cost_estimate"])
+def confidence_band(intercepts: np.ndarray, slopes: np.ndarray, grid: np.ndarray,
+                    level: float = CONFIDENCE) -> tuple:
+    """Return pointwise (lower, upper) percentile bands of the fitted lines."""
+    predictions = intercepts[:, None] + slopes[:, None] * grid[None, :]
+    tail = (1 - level) / 2 * 100
+    lower, upper = np.percentile(predictions, [tail, 100 - tail], axis=0)
+    return lower, upper
 
-    dates = monthly.index
-    cost = monthly["cost_estimate"]
-    x = np.arange(len(cost)).reshape(-1, 1)
 
-    # Plot cost trend
-    plt.figure(figsize=(10, 4))
-    plt.plot(dates, cost, "o-", label="Max Monthly Cost")
+def _doubling_time(slope: float) -> float:
+    return float(np.log10(2) / slope) if slope > 0 else float('inf')
+
+
+def _month_end(day: date) -> date:
+    if day.month == 12:
+        return date(day.year, 12, 31)
+    return date(day.year, day.month + 1, 1) - timedelta(days=1)
+
+
+def monthly_max(rows) -> tuple:
+    """Return (month-end dates, max cost per month) for months with data."""
+    best = {}
+    for row in rows:
+        cost = row["cost_estimate"]
+        if cost is None:
+            continue
+        key = (row["date"].year, row["date"].month)
+        if key not in best or cost > best[key]:
+            best[key] = cost
+    keys = sorted(best)
+    dates = [_month_end(date(y, m, 1)) for y, m in keys]
+    return dates, np.array([best[k] for k in keys], dtype=float)
+
+
+def compute_trends(rows, n_resamples: int = DEFAULT_RESAMPLES, seed: int = 0) -> dict:
+    """Aggregate rows by month and fit the linear and log-linear trends.
+
+    With ``n_resamples`` > 0 the fits are bootstrapped to give confidence
+    bands for both trend lines and an interval for the doubling time.
+    """
+    dates, cost = monthly_max(rows)
+    if not dates:
+        raise SystemExit(f"No data after {START_DATE.isoformat()}")
+
+    trends = {"dates": dates, "cost": cost,
+              "bootstrap": {"n_resamples": n_resamples, "seed": seed, "confidence": CONFIDENCE}}
+    bootstrap = n_resamples > 0 and len(cost) >= 3
+    tail = (1 - CONFIDENCE) / 2 * 100
+
     if len(cost) >= 2:
-        model = LinearRegression()
-        model.fit(x, cost)
-        trend = model.predict(x)
-        plt.plot(dates, trend, "--", label="Trend")
-        icpt, slope, p_icpt, p_slope = _regression_stats(x, cost.values)
-        info = f"slope={slope:.2f}, intercept={icpt:.2f}, p={p_slope:.3f}"
+        x = np.arange(len(cost), dtype=float)
+        icpt, slope, p_icpt, p_slope = _regression_stats(x, cost)
+        trends["linear"] = {"intercept": icpt, "slope": slope,
+                            "p_intercept": p_icpt, "p_slope": p_slope}
+        if bootstrap:
+            intercepts, slopes = bootstrap_fit(x, cost, n_resamples, seed)
+            trends["linear_band"] = confidence_band(intercepts, slopes, x)
+
+    # Regress log10 cost on the time in years since the first month
+    years = np.array([(d - dates[0]).days / 365.0 for d in dates])
+    log_cost = np.log10(cost)
+    icpt, slope, p_icpt, p_slope = _regression_stats(years, log_cost)
+    trends["years"] = years
+    trends["log_cost"] = log_cost
+    trends["log"] = {"intercept": icpt, "slope": slope,
+                     "p_intercept": p_icpt, "p_slope": p_slope,
+                     "doubling_time_years": _doubling_time(slope)}
+
+    # Extend the regression line to the target decade on the log chart.  Only
+    # a rising trend gets there; a single month has no slope at all.
+    years_to_target = (LOG_CHART["extrapolate_to"] - icpt) / slope if slope > 0 else np.inf
+    if years_to_target <= MAX_EXTRAPOLATION_YEARS:
+        extended_years = np.linspace(0, years_to_target, 100)
+        trends["log_extension"] = {"years": extended_years,
+                                   "trend": icpt + slope * extended_years}
+
+    if bootstrap:
+        intercepts, slopes = bootstrap_fit(years, log_cost, n_resamples, seed)
+        if "log_extension" in trends:
+            lower, upper = confidence_band(intercepts, slopes, extended_years)
+            trends["log_extension"]["lower"] = lower
+            trends["log_extension"]["upper"] = upper
+        # The doubling time decreases with the slope, so the slope's upper
+        # percentile gives the lower bound of the doubling time.
+        slope_lo, slope_hi = np.percentile(slopes, [tail, 100 - tail])
+        trends["log"]["slope_ci"] = (float(slope_lo), float(slope_hi))
+        trends["log"]["doubling_time_ci"] = (_doubling_time(slope_hi),
+                                             _doubling_time(slope_lo))
+        trends["n_resamples"] = len(slopes)
+    return trends
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _render_cost_chart(trends: dict, output: str) -> None:
+    plt = _pyplot()
+    dates = trends["dates"]
+    cost = trends["cost"]
+
+    plt.figure(figsize=COST_CHART["figsize"])
+    plt.plot(dates, cost, "o-", label="Max Monthly Cost")
+    if "linear" in trends:
+        lin = trends["linear"]
+        x = np.arange(len(cost))
+        plt.plot(dates, lin["intercept"] + lin["slope"] * x, "--", label="Trend")
+        if "linear_band" in trends:
+            lower, upper = trends["linear_band"]
+            plt.fill_between(dates, lower, upper, alpha=0.2,
+                             label=f"{CONFIDENCE:.0%} bootstrap band")
+        info = (f"slope={lin['slope']:.2f}, intercept={lin['intercept']:.2f}, "
+                f"p={lin['p_slope']:.3f}")
         plt.text(0.05, 0.95, info, transform=plt.gca().transAxes,
                  ha="left", va="top", fontsize=8,
                  bbox=dict(facecolor="white", alpha=0.5))
     plt.xlabel("Date")
     plt.ylabel("Cost Estimate")
-    plt.title("Monthly Max First Day Cost Trend")
+    plt.title(COST_CHART["title"])
     plt.legend()
     plt.tight_layout()
-    plt.savefig("cost_trend.png")
+    plt.savefig(output)
+    plt.close()
 
-    # Plot log10 of cost with regression
-    # Convert dates to numeric format in years for regression
-    date_numeric = ((dates - dates[0]).days / 365.0).values.reshape(-1, 1)
 
-    # Perform regression on log cost
-    log_cost = np.log10(cost.values)
+def _render_log_chart(trends: dict, output: str) -> None:
+    plt = _pyplot()
+    dates = trends["dates"]
+    log = trends["log"]
+    icpt, slope = log["intercept"], log["slope"]
 
-    # Regression model
-    plt.figure(figsize=(10, 4))
-    model = LinearRegression()
-    model.fit(date_numeric, log_cost)
-    trend = model.predict(date_numeric)
-    icpt, slope, p_icpt, p_slope = _regression_stats(date_numeric, log_cost)
-
-    # Plot data and trend
-    plt.plot(dates, log_cost, "o-", label="Log10 Max Monthly Cost")
+    plt.figure(figsize=LOG_CHART["figsize"])
+    plt.plot(dates, trends["log_cost"], "o-", label="Log10 Max Monthly Cost")
 
     # Use actual dollar values for the y-axis labels.
-    ticks = range(3, 7)
+    ticks = range(*LOG_CHART["decades"])
     plt.yticks(list(ticks), [f"${10 ** t:,.0f}" for t in ticks])
 
-    # Extend the regression line to log10(cost) == 6
-    years_to_log6 = (6 - icpt) / slope
-    extended_years = np.linspace(0, years_to_log6, 100).reshape(-1, 1)
-    extended_dates = dates[0] + pd.to_timedelta(extended_years.ravel() * 365, unit="D")
-    extended_trend = model.predict(extended_years)
-
-    plt.plot(extended_dates, extended_trend, color="red", label="Exponential Extrapolation")
+    # Extend the regression line to log10(cost) == 6 (absent unless rising)
+    extension = trends.get("log_extension")
+    if extension:
+        start = datetime.combine(dates[0], datetime.min.time())
+        extended_dates = [start + timedelta(days=float(y) * 365) for y in extension["years"]]
 
-    doubling_time = np.log10(2) / slope if slope > 0 else float('inf')
+        plt.plot(extended_dates, extension["trend"], color="red", label="Exponential Extrapolation")
+        if "lower" in extension:
+            plt.fill_between(extended_dates, extension["lower"], extension["upper"],
+                             color="red", alpha=0.15,
+                             label=f"{CONFIDENCE:.0%} bootstrap band")
 
     info = (f"log10(cost) = {icpt:.3f} + {slope:.3f} · years\n"
-            f"T_double = log10(2) / {slope:.3f} ≈ {doubling_time:.1f} years\n"
-            f"p={p_slope:.3f}")
+            f"T_double = log10(2) / {slope:.3f} ≈ {log['doubling_time_years']:.1f} years")
+    if "doubling_time_ci" in log:
+        lo, hi = log["doubling_time_ci"]
+        info += f" ({CONFIDENCE:.0%} CI {lo:.1f}–{hi:.1f})"
+    info += f"\np={log['p_slope']:.3f}"
     plt.text(0.05, 0.95, info, transform=plt.gca().transAxes,
              ha="left", va="top", fontsize=8,
              bbox=dict(facecolor="white", alpha=0.5))
 
     plt.xlabel("Date")
     plt.ylabel("Log10 Cost Estimate")
-    plt.title("Cocomo II estimation of the cost to produce the code written after one day\n(Grouped by most productive first-day repo in each month)")
+    plt.title(LOG_CHART["title"])
     plt.legend()
     plt.tight_layout()
-    plt.savefig("log_cost_trend.png")
+    plt.savefig(output)
+    plt.close()
+
+
+def _band(band):
+    """Return a (lower, upper) band as lists for the chart cache key."""
+    return None if band is None else [np.asarray(edge).tolist() for edge in band]
+
+
+def render(trends: dict, cost_output: str = "cost_trend.png",
+           log_output: str = "log_cost_trend.png", force: bool = False) -> list:
+    """Draw the linear and logarithmic cost charts; return the rebuilt paths.
+
+    A chart is skipped when its data and parameters hash to the key stored
+    next to the existing image, unless ``force`` is set.
+    """
+    summary = trends_summary(trends)
+    extension = trends.get("log_extension", {})
+    rebuilt = []
+    if chart_cache.render_cached(
+        cost_output,
+        {"months": summary["months"], "linear": summary.get("linear"),
+         "bootstrap": trends["bootstrap"], "band": _band(trends.get("linear_band"))},
+        COST_CHART,
+        lambda: _render_cost_chart(trends, cost_output),
+        force,
+    ):
+        rebuilt.append(cost_output)
+    if chart_cache.render_cached(
+        log_output,
+        {"months": summary["months"], "log": summary["log"],
+         "bootstrap": trends["bootstrap"],
+         "band": _band((extension["lower"], extension["upper"]) if "lower" in extension else None)},
+        LOG_CHART,
+        lambda: _render_log_chart(trends, log_output),
+        force,
+    ):
+        rebuilt.append(log_output)
+    return rebuilt
+
+
+def trends_summary(trends: dict) -> dict:
+    """Return a JSON-serialisable summary of the computed trends."""
+    summary = {
+        "months": [
+            {"month": d.strftime("%Y-%m"), "max_cost": float(c)}
+            for d, c in zip(trends["dates"], trends["cost"])
+        ],
+        "log": {k: list(v) if isinstance(v, tuple) else float(v)
+                for k, v in trends["log"].items()},
+    }
+    if "linear" in trends:
+        summary["linear"] = {k: float(v) for k, v in trends["linear"].items()}
+    if "n_resamples" in trends:
+        summary["n_resamples"] = trends["n_resamples"]
+    return summary
+
+
+def print_text(summary: dict) -> None:
+    for month in summary["months"]:
+        print(f"{month['month']}: ${month['max_cost']:,.2f}")
+    if "linear" in summary:
+        lin = summary["linear"]
+        print(f"linear: slope={lin['slope']:.2f}, intercept={lin['intercept']:.2f}, "
+              f"p={lin['p_slope']:.3f}")
+    log = summary["log"]
+    print(f"log10(cost) = {log['intercept']:.3f} + {log['slope']:.3f} · years, "
+          f"p={log['p_slope']:.3f}")
+    line = f"doubling time ≈ {log['doubling_time_years']:.1f} years"
+    if "doubling_time_ci" in log:
+        lo, hi = log["doubling_time_ci"]
+        line += f" ({CONFIDENCE:.0%} CI {lo:.1f}–{hi:.1f}, {summary['n_resamples']} resamples)"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot monthly first-day cost trends")
+    parser.add_argument(
+        "--input",
+        default=str(results_store.default_source()),
+        help="Input results store or CSV file",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["png", "text", "json"],
+        default="png",
+        help="Render PNG charts (default) or print the trend data without plotting",
+    )
+    parser.add_argument(
+        "--bootstrap",
+        type=int,
+        default=DEFAULT_RESAMPLES,
+        metavar="N",
+        help=f"Bootstrap resamples for confidence bands, 0 to disable (default: {DEFAULT_RESAMPLES})",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Random seed for the bootstrap (fixed so charts stay reproducible)",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Re-render charts even if their data and parameters are unchanged",
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="Report start-up, load, compute and render times on stderr",
+    )
+    args = parser.parse_args(argv)
+
+    t_start = time.perf_counter()
+    rows = results_store.load_results(
+        args.input,
+        columns=["date", "cost_estimate"],
+        filters=[("date", ">=", START_DATE)],
+    )
+    t_loaded = time.perf_counter()
+    trends = compute_trends(rows, args.bootstrap, args.seed)
+    t_computed = time.perf_counter()
+
+    if args.format == "png":
+        render(trends, force=args.force)
+    elif args.format == "json":
+        print(json.dumps(trends_summary(trends), indent=2))
+    else:
+        print_text(trends_summary(trends))
+    t_done = time.perf_counter()
+
+    if args.timings:
+        print(
+            f"timings: imports {_T_IMPORTS - _T0:.3f}s, load {t_loaded - t_start:.3f}s, "
+            f"compute {t_computed - t_loaded:.3f}s, output {t_done - t_computed:.3f}s, "
+            f"total {t_done - _T0:.3f}s",
+            file=sys.stderr,
+        )
 
 
 if __name__ == '__main__':
     main()
-
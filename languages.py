@@ -0,0 +1,148 @@
+"""Source language classification.
+
+``classify`` maps a file to a canonical language name using lookup tables
+for file names, extensions and ``#!`` interpreters.  The tables and the
+shebang pattern are built once at import, so classifying a file costs a
+couple of dict lookups (plus reading the first line for extensionless
+scripts).  ``canonical`` maps SLOCCount's language names onto the same
+vocabulary, which is also the one used by ``cost_estimator.LANGUAGE_FACTOR``.
+"""
+
+import os
+import re
+
+_EXTENSIONS = {
+    "python": [".py", ".pyw", ".pyi", ".pyx"],
+    "golang": [".go"],
+    "haskell": [".hs", ".lhs"],
+    "pascal": [".pas", ".pp", ".dpr", ".lpr"],
+    "c": [".c", ".h"],
+    "cpp": [".cc", ".cpp", ".cxx", ".c++", ".hh", ".hpp", ".hxx"],
+    "csharp": [".cs"],
+    "java": [".java"],
+    "kotlin": [".kt", ".kts"],
+    "javascript": [".js", ".mjs", ".cjs", ".jsx"],
+    "typescript": [".ts", ".tsx"],
+    "rust": [".rs"],
+    "ruby": [".rb"],
+    "php": [".php"],
+    "perl": [".pl", ".pm"],
+    "shell": [".sh", ".bash", ".zsh", ".ksh"],
+    "sql": [".sql"],
+    "lisp": [".lisp", ".el", ".scm", ".clj"],
+    "ml": [".ml", ".mli"],
+    "fortran": [".f", ".f77", ".f90", ".f95"],
+    "r": [".r"],
+    "swift": [".swift"],
+    "objc": [".m", ".mm"],
+    "latex": [".tex", ".sty", ".cls"],
+    "make": [".mk", ".mak"],
+}
+
+_FILENAMES = {
+    "Makefile": "make",
+    "makefile": "make",
+    "GNUmakefile": "make",
+    "Dockerfile": "shell",
+    "Rakefile": "ruby",
+    "Gemfile": "ruby",
+    "SConstruct": "python",
+    "SConscript": "python",
+}
+
+_INTERPRETERS = {
+    "python": "python",
+    "pypy": "python",
+    "sh": "shell",
+    "bash": "shell",
+    "dash": "shell",
+    "zsh": "shell",
+    "ksh": "shell",
+    "perl": "perl",
+    "ruby": "ruby",
+    "node": "javascript",
+    "nodejs": "javascript",
+    "php": "php",
+    "runghc": "haskell",
+    "runhaskell": "haskell",
+    "Rscript": "r",
+}
+
+# SLOCCount language names that differ from ours.
+_SLOCCOUNT_NAMES = {
+    "ansic": "c",
+    "sh": "shell",
+    "csh": "shell",
+    "cs": "csharp",
+    "f90": "fortran",
+    "makefile": "make",
+}
+
+EXTENSIONS = {ext: lang for lang, exts in _EXTENSIONS.items() for ext in exts}
+
+# "#!/usr/bin/python3.11", "#!/usr/bin/env -S python3 -u", "#! /bin/sh"
+_SHEBANG = re.compile(rb"#!\s*(?:\S*/)?([A-Za-z_]+)[\d.]*(?:\s+(?:-\S+\s+)*([A-Za-z_]+)[\d.]*)?")
+
+
+def _from_shebang(head: bytes):
+    match = _SHEBANG.match(head)
+    if not match:
+        return None
+    interpreter = match.group(1).decode()
+    if interpreter == "env" and match.group(2):
+        interpreter = match.group(2).decode()
+    return _INTERPRETERS.get(interpreter)
+
+
+def classify(path, head: bytes = None):
+    """Return the canonical language of ``path``, or None if it isn't source.
+
+    Extensionless files are classified by their ``#!`` line; ``head`` may
+    supply the start of the file, otherwise its first line is read.
+    """
+    name = os.path.basename(path)
+    language = _FILENAMES.get(name)
+    if language:
+        return language
+    ext = os.path.splitext(name)[1]
+    if ext:
+        return EXTENSIONS.get(ext.lower())
+    if head is None:
+        try:
+            with open(path, "rb") as f:
+                head = f.readline(256)
+        except OSError:
+            return None
+    return _from_shebang(head)
+
+
+def canonical(name: str) -> str:
+    """Map a language name (e.g. SLOCCount's ``ansic``) onto our vocabulary."""
+    name = name.lower()
+    return _SLOCCOUNT_NAMES.get(name, name)
+
+
+def dominant(languages: dict):
+    """Return the language with the most SLOC in a {language: sloc} mapping."""
+    if not languages:
+        return None
+    return max(sorted(languages), key=lambda lang: languages[lang])
+
+
+def format_breakdown(languages: dict) -> str:
+    """Encode {language: sloc} as ``"python:300;shell:12"`` (largest first)."""
+    items = sorted(languages.items(), key=lambda item: (-item[1], item[0]))
+    return ";".join(f"{lang}:{sloc}" for lang, sloc in items)
+
+
+def parse_breakdown(text: str) -> dict:
+    """Decode the ``format_breakdown`` representation."""
+    languages = {}
+    for item in text.split(";"):
+        if not item:
+            continue
+        lang, _, sloc = item.rpartition(":")
+        if not lang:
+            raise ValueError(f"invalid language breakdown item {item!r}")
+        languages[lang] = int(sloc)
+    return languages
@@ -1,51 +1,97 @@
-import csv
-from datetime import datetime
+"""List the highest cost repositories per time bucket.
+
+Rows are streamed from the results store in a single pass and only a
+bounded heap of the ``--top`` rows is kept for each bucket, so memory use is
+proportional to buckets x K rather than to the number of rows.
+"""
+
 import argparse
+import heapq
+from functools import lru_cache
+
+import results_store
+
+BUCKETS = ("week", "month", "quarter")
+GROUP_BY = ("language", "owner")
+
+
+def iter_rows(source, group_by=None):
+    """Stream typed rows from the results store or CSV."""
+    columns = ["repo", "date", "total_lines", "cost_estimate"]
+    if group_by:
+        columns.append(group_by)
+    return results_store.iter_results(
+        source,
+        columns=columns,
+        filters=[("total_lines", ">=", 0), ("cost_estimate", ">=", 0)],
+    )
+
+
+@lru_cache(maxsize=4096)
+def bucket_label(day, bucket="month"):
+    """Return the label of the week, month or quarter containing ``day``."""
+    if bucket == "week":
+        year, week, _ = day.isocalendar()
+        return f"{year:04d}-W{week:02d}"
+    if bucket == "quarter":
+        return f"{day.year:04d}-Q{(day.month - 1) // 3 + 1}"
+    return f"{day.year:04d}-{day.month:02d}"
 
 
-def load_rows(csv_file: str):
-    """Load rows from CSV and parse numeric fields."""
-    rows = []
-    with open(csv_file, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            try:
-                row["date"] = datetime.strptime(row["date"], "%Y-%m-%d")
-                row["total_lines"] = int(row["total_lines"])
-                row["cost_estimate"] = float(row["cost_estimate"])
-                rows.append(row)
-            except Exception:
-                continue
-    return rows
+def _group_label(row, group_by):
+    # firstday records the owner from the origin remote; None without one.
+    return row[group_by] or "unknown"
+
+
+def top_per_bucket(rows, k=1, bucket="month", group_by=None):
+    """Return sorted (label, rows) pairs with the ``k`` highest cost rows per bucket.
+
+    ``label`` is the time bucket, followed by the language or owner in
+    brackets when ``group_by`` is given.  Rows within a bucket are ordered by
+    descending cost; ties keep the row that was seen first.
+    """
+    heaps = {}
+    for seq, row in enumerate(rows):
+        label = bucket_label(row["date"], bucket)
+        if group_by:
+            label = f"{label} [{_group_label(row, group_by)}]"
+        heap = heaps.get(label)
+        if heap is None:
+            heap = heaps[label] = []
+        item = (row["cost_estimate"], -seq, row)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    return [
+        (label, [row for _, _, row in sorted(heaps[label], key=lambda i: i[:2], reverse=True)])
+        for label in sorted(heaps)
+    ]
 
 
 def monthly_max(rows):
     """Return list of (YYYY-MM, row) for highest cost each month."""
-    data = {}
-    for row in rows:
-        month = row["date"].strftime("%Y-%m")
-        current = data.get(month)
-        if current is None or row["cost_estimate"] > current["cost_estimate"]:
-            data[month] = row
-    return [(m, data[m]) for m in sorted(data.keys())]
+    return [(label, top[0]) for label, top in top_per_bucket(rows)]
 
 
 def plot_scatter(data, output="loc_vs_cost.png"):
     """Create scatter plot of lines vs cost for the monthly data."""
     try:
+        import matplotlib
+        matplotlib.use("Agg")
         import matplotlib.pyplot as plt
     except ImportError:
         print("matplotlib is required for plotting")
         return
 
-    lines = [row["total_lines"] for _, row in data]
-    cost = [row["cost_estimate"] for _, row in data]
+    lines = [row["total_lines"] for _, top in data for row in top]
+    cost = [row["cost_estimate"] for _, top in data for row in top]
 
     plt.figure(figsize=(6, 4))
     plt.scatter(lines, cost)
     plt.xlabel("Lines of Code")
     plt.ylabel("Cost Estimate")
-    plt.title("Lines of Code vs Cost (Monthly Max)")
+    plt.title("Lines of Code vs Cost (Top Repositories per Period)")
     plt.tight_layout()
     plt.savefig(output)
     print(f"Saved {output}")
@@ -53,25 +99,42 @@ def plot_scatter(data, output="loc_vs_cost.png"):
 
 def main(argv=None):
     parser = argparse.ArgumentParser(
-        description="List highest value repo for each month"
+        description="List highest value repos for each month (or week/quarter)"
+    )
+    parser.add_argument(
+        "--input",
+        "--csv",
+        dest="input",
+        default=str(results_store.default_source()),
+        help="Input results store or CSV file",
+    )
+    parser.add_argument(
+        "--top", type=int, default=1, help="Repositories to list per bucket (default: 1)"
+    )
+    parser.add_argument(
+        "--bucket", choices=BUCKETS, default="month", help="Time bucket (default: month)"
     )
     parser.add_argument(
-        "--csv", default="first_day_analysis.csv", help="Input CSV file"
+        "--group-by", choices=GROUP_BY, help="Also bucket by language or repository owner"
     )
     parser.add_argument(
         "--plot", action="store_true", help="Generate scatter plot"
     )
     args = parser.parse_args(argv)
+    if args.top < 1:
+        parser.error("--top must be at least 1")
 
-    rows = load_rows(args.csv)
-    if not rows:
+    data = top_per_bucket(iter_rows(args.input, args.group_by), args.top,
+                          args.bucket, args.group_by)
+    if not data:
         raise SystemExit("No data found")
 
-    data = monthly_max(rows)
-    for month, row in data:
-        print(
-            f"{month}: {row['repo']} - {row['total_lines']} lines, ${row['cost_estimate']:.2f}"
-        )
+    for label, top in data:
+        for rank, row in enumerate(top, start=1):
+            prefix = f"{label} #{rank}" if args.top > 1 else label
+            print(
+                f"{prefix}: {row['repo']} - {row['total_lines']} lines, ${row['cost_estimate']:.2f}"
+            )
 
     if args.plot:
         plot_scatter(data)
@@ -0,0 +1,248 @@
+"""Wait for branch updates in a set of git repositories.
+
+``RefWatcher`` uses Linux inotify (through ctypes, no extra dependency) on
+each repository's ``HEAD``, ``packed-refs`` and ``refs/heads`` tree, so a
+process blocked in ``wait`` uses no CPU until git moves a ref.  Where
+inotify is unavailable ``PollingRefWatcher`` compares the modification
+times of the same files at a fixed interval instead.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+_EVENT = struct.Struct("iIII")
+_GIT_DIR_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+_REFS_MASK = _GIT_DIR_MASK | IN_MOVED_FROM | IN_DELETE_SELF
+# Files directly inside the git directory that move when a branch advances.
+_GIT_DIR_FILES = {"HEAD", "packed-refs"}
+
+
+def git_dir(repo: Path) -> Path:
+    """Return the git directory of ``repo``, following ``.git`` files."""
+    dot_git = repo / ".git"
+    if dot_git.is_file():
+        text = dot_git.read_text().strip()
+        if text.startswith("gitdir:"):
+            path = Path(text[len("gitdir:"):].strip())
+            return path if path.is_absolute() else (repo / path).resolve()
+    return dot_git
+
+
+def _walk_dirs(directory: Path):
+    """Yield ``directory`` and all directories below it."""
+    for root, _, _ in os.walk(directory):
+        yield Path(root)
+
+
+def _refs_dirs(gdir: Path):
+    """Yield ``refs/heads`` and all directories below it."""
+    return _walk_dirs(gdir / "refs" / "heads")
+
+
+class RefWatcher:
+    """Block until branch refs change in any of the watched repositories."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = {}  # wd -> (repo, directory, is_git_dir)
+        self.repos = set()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add_watch(self, repo: Path, directory: Path, is_git_dir: bool) -> None:
+        mask = _GIT_DIR_MASK if is_git_dir else _REFS_MASK
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                print("inotify watch limit reached; raise fs.inotify.max_user_watches",
+                      file=sys.stderr)
+            elif err != errno.ENOENT:
+                print(f"Cannot watch {directory}: {os.strerror(err)}", file=sys.stderr)
+            return
+        self._watches[wd] = (repo, directory, is_git_dir)
+
+    def add_repo(self, repo: Path) -> None:
+        """Start watching ``repo`` (no-op if it is already watched)."""
+        if repo in self.repos:
+            return
+        self.repos.add(repo)
+        gdir = git_dir(repo)
+        self._add_watch(repo, gdir, True)
+        for directory in _refs_dirs(gdir):
+            self._add_watch(repo, directory, False)
+
+    def remove_repo(self, repo: Path) -> None:
+        """Stop watching ``repo`` so it can be added again if it reappears."""
+        self.repos.discard(repo)
+        for wd in [wd for wd, watch in self._watches.items() if watch[0] == repo]:
+            del self._watches[wd]
+            # Fails harmlessly if the kernel already dropped the watch.
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    def _read_events(self, changed: set) -> None:
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so any repository may have changed.
+                changed.update(self.repos)
+                continue
+            watch = self._watches.get(wd)
+            if watch is None:
+                continue
+            repo, directory, is_git_dir = watch
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                if is_git_dir:
+                    # The git directory is gone; let the caller notice.
+                    changed.add(repo)
+                continue
+            if is_git_dir:
+                if name in _GIT_DIR_FILES:
+                    changed.add(repo)
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New namespace such as refs/heads/feature/; watch it too.
+                for sub in _walk_dirs(directory / name):
+                    self._add_watch(repo, sub, False)
+                changed.add(repo)
+            elif not name.endswith(".lock"):
+                changed.add(repo)
+
+    def wait(self, timeout=None, settle: float = 1.0) -> set:
+        """Return the repositories whose refs changed.
+
+        Blocks for up to ``timeout`` seconds (forever if None) for the first
+        change, then keeps collecting for ``settle`` seconds so a burst of
+        ref updates (a rebase, a pull across several repos) is reported as
+        one batch.  Returns an empty set on timeout.
+        """
+        changed = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed
+        self._read_events(changed)
+        deadline = time.monotonic() + settle
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if ready:
+                self._read_events(changed)
+        return changed
+
+
+class PollingRefWatcher:
+    """Fallback watcher comparing ref file modification times."""
+
+    def __init__(self, interval: float = 30.0):
+        self.interval = interval
+        self.repos = set()
+        self._state = {}
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _snapshot(self, repo: Path) -> tuple:
+        gdir = git_dir(repo)
+        paths = [gdir / name for name in sorted(_GIT_DIR_FILES)]
+        for directory in _refs_dirs(gdir):
+            try:
+                paths.extend(sorted(directory.iterdir()))
+            except OSError:
+                continue
+        stamps = []
+        for path in paths:
+            try:
+                stamps.append((str(path), path.stat().st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(stamps)
+
+    def add_repo(self, repo: Path) -> None:
+        if repo in self.repos:
+            return
+        self.repos.add(repo)
+        self._state[repo] = self._snapshot(repo)
+
+    def remove_repo(self, repo: Path) -> None:
+        """Stop watching ``repo`` so it can be added again if it reappears."""
+        self.repos.discard(repo)
+        self._state.pop(repo, None)
+
+    def wait(self, timeout=None, settle: float = 1.0) -> set:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for repo in self.repos:
+                snapshot = self._snapshot(repo)
+                if snapshot != self._state[repo]:
+                    self._state[repo] = snapshot
+                    changed.add(repo)
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return changed
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(0.0, deadline - time.monotonic()))
+            time.sleep(delay)
+
+
+def make_watcher(poll_interval: float = 30.0):
+    """Return an inotify watcher, or a polling one if inotify is unavailable."""
+    try:
+        return RefWatcher()
+    except (OSError, AttributeError) as e:
+        print(f"inotify unavailable ({e}); polling refs every {poll_interval:g}s",
+              file=sys.stderr)
+        return PollingRefWatcher(poll_interval)
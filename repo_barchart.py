@@ -1,48 +1,224 @@
-"""Generate a barchart of cost per repository using matplotlib."""
+"""Generate a barchart of cost per repository using matplotlib.
 
-import pandas as pd
-import matplotlib.pyplot as plt
+Only the ``--top`` most expensive bars are drawn; the rest are summed into a
+single "others" bar, so the image size and render time stay bounded however
+many repositories there are.  Bars can also be grouped by language or by the
+month of the first commit.
+"""
 
+import time
 
-def make_chart(csv_file: str, output: str = "repo_barchart.png") -> None:
-    """Create a bar chart from the analysis CSV."""
+_T0 = time.perf_counter()
 
-    df = pd.read_csv(csv_file)
-    if df.empty:
+import argparse
+import json
+import sys
+
+import chart_cache
+import results_store
+
+_T_IMPORTS = time.perf_counter()
+
+DEFAULT_TOP = 40
+GROUP_BY = ("repo", "language", "month")
+
+# Rendering parameters; part of the chart's cache key.
+CHART = {
+    "version": 2,
+    "width": 10,
+    "bar_height": 0.6,
+    "bar_inches": 0.3,
+    "color": "orange",
+    "others_color": "grey",
+}
+
+
+def _group_key(row: dict, group_by: str) -> str:
+    if group_by == "month":
+        return row["date"].strftime("%Y-%m")
+    return row["repo"]
+
+
+def _language_shares(row: dict) -> list:
+    """Return (language, share of the repo's SLOC) pairs for one row."""
+    breakdown = row["languages"]
+    sloc = sum(breakdown.values()) if breakdown else 0
+    if sloc <= 0:
+        return [(row["language"] or "unknown", 1.0)]
+    return [(lang, lines / sloc) for lang, lines in breakdown.items()]
+
+
+def costs_from_rows(rows, group_by: str = "repo") -> list:
+    """Return (label, cost in $k, repo count) sorted with the most expensive first.
+
+    With ``group_by="language"`` each repository's cost is split across its
+    languages by SLOC share, and counts the repository once per language.
+    Rows without a positive cost are ignored.
+    """
+    totals = {}
+    counts = {}
+    for row in rows:
+        if not row["cost_estimate"] or row["cost_estimate"] <= 0:
+            continue
+        if group_by == "language":
+            shares = _language_shares(row)
+        else:
+            shares = [(_group_key(row, group_by), 1.0)]
+        for key, share in shares:
+            # Scale cost to thousands of dollars for readability
+            totals[key] = totals.get(key, 0.0) + share * row["cost_estimate"] / 1000.0
+            counts[key] = counts.get(key, 0) + 1
+    if not totals:
         raise ValueError("No data found")
 
-    df = df[df.cost_estimate > 0]
+    # Sort by cost so the most expensive appear at the top.
+    bars = [(key, totals[key], counts[key]) for key in totals]
+    bars.sort(key=lambda bar: bar[1], reverse=True)
+    return bars
+
 
-    # Scale cost to thousands of dollars for readability
-    df["cost_k"] = df["cost_estimate"] / 1000.0
+def load_costs(source, group_by: str = "repo") -> list:
+    """Read the results (store or CSV) and return ``costs_from_rows`` bars."""
+    columns = ["repo", "cost_estimate"]
+    if group_by == "language":
+        columns.extend(["language", "languages"])
+    elif group_by == "month":
+        columns.append("date")
+    rows = results_store.iter_results(source, columns=columns, filters=[("cost_estimate", ">", 0)])
+    return costs_from_rows(rows, group_by)
 
-    # Sort repositories by cost so the most expensive appear at the top.
-    df.sort_values("cost_k", ascending=False, inplace=True)
 
-    y = range(len(df))
-    height = 0.6
+def top_bars(bars: list, top: int) -> list:
+    """Keep the ``top`` most expensive bars and sum the rest into "others".
 
-    # Use a dynamic height so that all repositories are visible even if there
-    # are many of them.
-    fig_height = max(4, 0.3 * len(df) + 2)
-    fig, ax = plt.subplots(figsize=(10, fig_height))
+    ``bars`` must already be sorted by cost, as returned by ``load_costs``.
+    """
+    if top <= 0 or len(bars) <= top:
+        return bars
+    rest = bars[top:]
+    others_cost = sum(cost for _, cost, _ in rest)
+    others_count = sum(count for _, _, count in rest)
+    return bars[:top] + [(f"others ({len(rest)})", others_cost, others_count)]
 
-    ax.barh(list(y), df["cost_k"], height,
-            label="Cost ($k)", color="orange")
 
-    ax.set_ylabel("Repository")
+def _render(bars: list, output: str, log_scale: bool, ylabel: str) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    y = range(len(bars))
+    height = CHART["bar_height"]
+
+    # Grow the figure with the number of bars; top_bars keeps that bounded.
+    fig_height = max(4, CHART["bar_inches"] * len(bars) + 2)
+    fig, ax = plt.subplots(figsize=(CHART["width"], fig_height))
+
+    colors = [CHART["color"]] * len(bars)
+    if bars and bars[-1][0].startswith("others ("):
+        colors[-1] = CHART["others_color"]
+    ax.barh(list(y), [cost for _, cost, _ in bars], height,
+            label="Cost ($k)", color=colors)
+
+    ax.set_ylabel(ylabel)
     ax.set_xlabel("Cost ($k)")
+    if log_scale:
+        ax.set_xscale("log")
     ax.set_yticks(list(y))
-    ax.set_yticklabels(df["repo"])
+    ax.set_yticklabels([label for label, _, _ in bars])
     ax.invert_yaxis()  # Highest values at the top
     ax.legend()
     plt.tight_layout()
     plt.savefig(output)
-    print(f"Saved {output}")
+    plt.close(fig)
+
+
+def render(bars: list, output: str = "repo_barchart.png", force: bool = False,
+           log_scale: bool = False, group_by: str = "repo") -> bool:
+    """Draw the horizontal bar chart for ``bars`` unless it is up to date."""
+    ylabel = "Repository" if group_by == "repo" else group_by.capitalize()
+    params = dict(CHART, log_scale=log_scale, ylabel=ylabel)
+    return chart_cache.render_cached(
+        output, bars, params, lambda: _render(bars, output, log_scale, ylabel), force
+    )
+
+
+def make_chart(source: str, output: str = "repo_barchart.png", force: bool = False,
+               top: int = DEFAULT_TOP, group_by: str = "repo",
+               log_scale: bool = False) -> bool:
+    """Create a bar chart from the analysis results (store or CSV)."""
+    bars = top_bars(load_costs(source, group_by), top)
+    return render(bars, output, force, log_scale, group_by)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Bar chart of first-day cost per repository")
+    parser.add_argument(
+        "-i",
+        "--input",
+        default=str(results_store.default_source()),
+        help="Input results store or CSV file",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="repo_barchart.png",
+        help="Output image (default: repo_barchart.png)",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=DEFAULT_TOP,
+        help=f"Number of bars to draw before summing the rest into 'others', "
+             f"0 for all (default: {DEFAULT_TOP})",
+    )
+    parser.add_argument(
+        "--group-by",
+        choices=GROUP_BY,
+        default="repo",
+        help="Draw one bar per repository (default), language or first-commit month",
+    )
+    parser.add_argument(
+        "--log-scale", action="store_true", help="Use a logarithmic cost axis"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["png", "text", "json"],
+        default="png",
+        help="Render a PNG chart (default) or print the bar data without plotting",
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Re-render the chart even if its data and parameters are unchanged",
+    )
+    parser.add_argument(
+        "--timings", action="store_true",
+        help="Report start-up, load and render times on stderr",
+    )
+    args = parser.parse_args(argv)
+
+    t_start = time.perf_counter()
+    bars = top_bars(load_costs(args.input, args.group_by), args.top)
+    t_loaded = time.perf_counter()
 
+    if args.format == "png":
+        render(bars, args.output, args.force, args.log_scale, args.group_by)
+    elif args.format == "json":
+        print(json.dumps(
+            [{args.group_by: label, "cost_k": cost, "repos": count}
+             for label, cost, count in bars],
+            indent=2,
+        ))
+    else:
+        for label, cost, count in bars:
+            print(f"{label}: ${cost:,.1f}k ({count} repos)")
+    t_done = time.perf_counter()
 
-def main() -> None:
-    make_chart("first_day_analysis.csv")
+    if args.timings:
+        print(
+            f"timings: imports {_T_IMPORTS - _T0:.3f}s, load {t_loaded - t_start:.3f}s, "
+            f"output {t_done - t_loaded:.3f}s, total {t_done - _T0:.3f}s",
+            file=sys.stderr,
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+"""Single command-line entry point for the repometrics scripts.
+
+``repometrics <command> [options]`` runs the ``main`` of the matching script.
+Scripts are imported only when their command is invoked, so numpy,
+matplotlib and friends are never loaded for a command that doesn't need
+them.  ``repometrics pipeline`` runs the scan, the cost update and the
+charts in one process, handing the results from step to step in memory.
+"""
+
+import argparse
+import importlib
+import sys
+from datetime import date
+from pathlib import Path
+
+# Command -> (module, description)
+COMMANDS = {
+    "firstday": ("firstday", "Analyze first-day commits of git repositories"),
+    "log": ("commit_logger", "Collect git commits into the commit database"),
+    "timesheet": ("daily_timesheet", "Print a timesheet from the commit database"),
+    "costs": ("cost_estimator", "Recompute cost estimates of the first-day results"),
+    "trends": ("generate_trends", "Plot monthly first-day cost trends"),
+    "barchart": ("repo_barchart", "Bar chart of first-day cost per repository"),
+    "monthly": ("monthly_top_repo", "List the highest cost repositories per period"),
+}
+
+
+def pipeline(argv=None):
+    """Scan repositories, recompute costs and render the charts in one process."""
+    import results_store
+
+    parser = argparse.ArgumentParser(
+        prog="repometrics pipeline",
+        description="Run firstday, costs, trends and barchart in one process",
+    )
+    parser.add_argument("-d", "--directory", default="~/devel",
+                        help="Directory containing repositories (default: ~/devel)")
+    parser.add_argument("-o", "--output", default=results_store.DEFAULT_CSV,
+                        help=f"CSV export (default: {results_store.DEFAULT_CSV})")
+    parser.add_argument("--store", default=results_store.DEFAULT_STORE,
+                        help=f"Results store (default: {results_store.DEFAULT_STORE})")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Repositories to analyze concurrently (default: 1)")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Skip cross-repository duplicate detection")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-render charts even if their data is unchanged")
+    args = parser.parse_args(argv)
+
+    import firstday
+
+    scan_argv = ["-d", args.directory, "-o", args.output, "--store", args.store,
+                 "--jobs", str(args.jobs)]
+    if args.no_dedup:
+        scan_argv.append("--no-dedup")
+    results = firstday.scan(scan_argv)
+    if not results:
+        return 1
+    # firstday keeps dates as strings; the report modules expect typed rows.
+    rows = [dict(result, date=date.fromisoformat(result["date"])) for result in results]
+
+    import cost_estimator
+
+    print("\nRecomputing cost estimates...")
+    cost_estimator.apply_costs(rows)
+    results_store.write_results(Path(args.store), rows)
+    results_store.export_csv(rows, Path(args.output))
+
+    import generate_trends
+    import repo_barchart
+
+    print("\nRendering charts...")
+    recent = [row for row in rows
+              if row["date"] >= generate_trends.START_DATE and row["cost_estimate"] is not None]
+    if recent:
+        generate_trends.render(generate_trends.compute_trends(recent), force=args.force)
+    else:
+        print(f"No data after {generate_trends.START_DATE.isoformat()}; skipping trend charts")
+    bars = repo_barchart.top_bars(repo_barchart.costs_from_rows(rows), repo_barchart.DEFAULT_TOP)
+    repo_barchart.render(bars, force=args.force)
+    return 0
+
+
+def _usage() -> str:
+    width = max(map(len, COMMANDS)) + 2
+    lines = ["usage: repometrics <command> [options]", "", "commands:"]
+    for name, (_, description) in COMMANDS.items():
+        lines.append(f"  {name:<{width}}{description}")
+    lines.append(f"  {'pipeline':<{width}}Run firstday, costs, trends and barchart in one process")
+    lines.append("")
+    lines.append("Run 'repometrics <command> --help' for the options of a command.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(_usage())
+        return 0
+    command, rest = argv[0], argv[1:]
+    if command == "pipeline":
+        return pipeline(rest)
+    if command not in COMMANDS:
+        print(f"repometrics: unknown command {command!r}\n\n{_usage()}", file=sys.stderr)
+        return 2
+
+    module = importlib.import_module(COMMANDS[command][0])
+    # The scripts' parsers take their program name from argv[0].
+    prog = sys.argv[0]
+    sys.argv[0] = f"repometrics {command}"
+    try:
+        status = module.main(rest)
+    finally:
+        sys.argv[0] = prog
+    # Most scripts return None on success, the others an exit status.
+    return status if isinstance(status, int) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
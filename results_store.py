@@ -0,0 +1,329 @@
+"""Typed results store for the first-day analysis.
+
+``firstday.py`` writes its results into a small SQLite database with typed
+columns, and every report script reads them back through ``iter_results`` /
+``load_results``.  The per-language SLOC breakdown of each repository is
+kept in a separate long table (one row per repository and language) and is
+returned as a ``{language: sloc}`` dict in the ``languages`` column.  The
+loader accepts either the SQLite store or a CSV file
+(the historical ``first_day_analysis.csv`` format), so existing CSV files keep
+working.  Column projection and filters are pushed down into SQL when reading
+from the store and applied while parsing when reading a CSV.
+"""
+
+import csv
+import heapq
+import itertools
+import operator
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import languages as lang_table
+
+DEFAULT_STORE = "first_day_analysis.sqlite"
+DEFAULT_CSV = "first_day_analysis.csv"
+
+TABLE = "first_day"
+LANGUAGES_TABLE = "first_day_languages"
+
+# Column name -> (SQLite type, parser for the CSV text representation).
+COLUMNS = {
+    "repo": ("TEXT NOT NULL", str),
+    "date": ("TEXT NOT NULL", date.fromisoformat),
+    "first_commit": ("TEXT NOT NULL", str),
+    "analysis_commit": ("TEXT", str),
+    "total_lines": ("INTEGER", int),
+    "cost_estimate": ("REAL", float),
+    "language": ("TEXT", str),
+    # User or organisation from the origin remote; None without a remote.
+    "owner": ("TEXT", str),
+    # SLOC not seen in any earlier repository (see dedup.py).
+    "novel_lines": ("INTEGER", int),
+    # {language: sloc}; stored in LANGUAGES_TABLE, "python:300;shell:12" in CSV.
+    "languages": (None, lang_table.parse_breakdown),
+    # ISO 8601 UTC time of the analysis; used to keep the newest row on merge.
+    "analyzed_at": ("TEXT", str),
+}
+
+REQUIRED_COLUMNS = ("repo", "date", "first_commit")
+
+# Columns of the main table; the others are computed from side tables.
+TABLE_COLUMNS = [name for name, (sql_type, _) in COLUMNS.items() if sql_type]
+
+_LANGUAGES_SQL = (
+    f"(SELECT group_concat(l.language || ':' || l.sloc, ';') FROM {LANGUAGES_TABLE} l "
+    f"WHERE l.repo = {TABLE}.repo AND l.first_commit = {TABLE}.first_commit)"
+)
+
+_OPERATORS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class ResultsStoreError(Exception):
+    """Raised for unreadable stores or invalid queries."""
+    pass
+
+
+def default_source(directory=".") -> Path:
+    """Return the store in ``directory`` if present, otherwise the CSV."""
+    base = Path(directory)
+    store = base / DEFAULT_STORE
+    return store if store.exists() else base / DEFAULT_CSV
+
+
+def is_store(path) -> bool:
+    """Return True if ``path`` refers to a SQLite results store."""
+    return Path(path).suffix.lower() in (".sqlite", ".sqlite3", ".db")
+
+
+def _check_columns(names):
+    unknown = [name for name in names if name not in COLUMNS]
+    if unknown:
+        raise ResultsStoreError(f"Unknown column(s): {', '.join(unknown)}")
+
+
+def _check_filters(filters):
+    for column, op, _ in filters:
+        _check_columns([column])
+        if column not in TABLE_COLUMNS:
+            raise ResultsStoreError(f"Cannot filter on column: {column}")
+        if op not in _OPERATORS and op != "in":
+            raise ResultsStoreError(f"Unsupported filter operator: {op}")
+
+
+def _sql_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return lang_table.format_breakdown(value)
+    return value
+
+
+def connect(store_path) -> sqlite3.Connection:
+    """Open the store, creating the table or adding missing columns."""
+    conn = sqlite3.connect(store_path)
+    columns = ", ".join(f"{name} {COLUMNS[name][0]}" for name in TABLE_COLUMNS)
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ({columns}, "
+        "PRIMARY KEY (repo, first_commit))"
+    )
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+    for name in TABLE_COLUMNS:
+        if name not in existing:
+            # ALTER TABLE cannot add NOT NULL columns without a default.
+            conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {name} {COLUMNS[name][0].split()[0]}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_date ON {TABLE} (date)")
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {LANGUAGES_TABLE} (repo TEXT NOT NULL, "
+        "first_commit TEXT NOT NULL, language TEXT NOT NULL, sloc INTEGER NOT NULL, "
+        "PRIMARY KEY (repo, first_commit, language))"
+    )
+    return conn
+
+
+def _iter_store(path, columns, filters, order_by):
+    if not Path(path).exists():
+        raise ResultsStoreError(f"Results store not found: {path}")
+    # Opened read-only: reports must not migrate someone else's store, and
+    # must work on read-only copies.  Columns an older store lacks read as NULL.
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")}
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    except sqlite3.DatabaseError as e:
+        conn.close()
+        raise ResultsStoreError(f"Cannot read results store {path}: {e}")
+    if TABLE not in tables:
+        conn.close()
+        return
+
+    def expression(name):
+        if name == "languages":
+            return _LANGUAGES_SQL if LANGUAGES_TABLE in tables else "NULL"
+        return name if name in existing else "NULL"
+
+    select = [f"{expression(name)} AS {name}" for name in columns]
+    sql = f"SELECT {', '.join(select)} FROM {TABLE}"
+    clauses = []
+    params = []
+    for column, op, value in filters:
+        if op == "in":
+            values = list(value)
+            clauses.append(f"{expression(column)} IN ({', '.join('?' * len(values))})")
+            params.extend(_sql_value(v) for v in values)
+        else:
+            clauses.append(f"{expression(column)} {op} ?")
+            params.append(_sql_value(value))
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if order_by:
+        sql += " ORDER BY " + ", ".join(name if name in columns else expression(name) for name in order_by)
+    try:
+        parse_date = "date" in columns
+        parse_languages = "languages" in columns
+        for values in conn.execute(sql, params):
+            row = dict(zip(columns, values))
+            if parse_date:
+                row["date"] = date.fromisoformat(row["date"])
+            if parse_languages:
+                row["languages"] = lang_table.parse_breakdown(row["languages"] or "")
+            yield row
+    finally:
+        conn.close()
+
+
+def _matches(row, filters) -> bool:
+    for column, op, value in filters:
+        current = row[column]
+        if current is None:
+            return False
+        if op == "in":
+            if current not in value:
+                return False
+        elif not _OPERATORS[op](current, value):
+            return False
+    return True
+
+
+def _iter_csv(path, columns, filters):
+    needed = list(dict.fromkeys(list(columns) + [c for c, _, _ in filters]))
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for line_no, raw in enumerate(reader, start=2):
+            row = {}
+            try:
+                for name in needed:
+                    text = (raw.get(name) or "").strip()
+                    if not text:
+                        if name in REQUIRED_COLUMNS:
+                            raise ValueError(f"missing {name}")
+                        row[name] = None
+                    else:
+                        row[name] = COLUMNS[name][1](text)
+            except ValueError as e:
+                print(f"{path}:{line_no}: skipping malformed row ({e})", file=sys.stderr)
+                continue
+            if filters and not _matches(row, filters):
+                continue
+            yield {name: row[name] for name in columns}
+
+
+def iter_results(source=None, columns=None, filters=None, order_by=None):
+    """Yield result rows as dicts with typed values.
+
+    ``columns`` restricts the returned columns, ``filters`` is a list of
+    ``(column, op, value)`` tuples combined with AND (``op`` is one of
+    ``= != < <= > >= in``) and ``order_by`` is a list of column names.
+    """
+    source = Path(source) if source is not None else default_source()
+    columns = list(columns) if columns else list(COLUMNS)
+    filters = list(filters or [])
+    _check_columns(columns)
+    _check_filters(filters)
+    if order_by:
+        _check_columns(order_by)
+
+    if is_store(source):
+        yield from _iter_store(source, columns, filters, order_by)
+        return
+
+    rows = _iter_csv(source, columns, filters)
+    if order_by:
+        if any(name not in columns for name in order_by):
+            raise ResultsStoreError("CSV sources can only be ordered by selected columns")
+        rows = sorted(rows, key=lambda r: tuple(r[name] for name in order_by))
+    yield from rows
+
+
+def load_results(source=None, columns=None, filters=None, order_by=None) -> list:
+    """Return all matching result rows as a list of dicts."""
+    return list(iter_results(source, columns, filters, order_by))
+
+
+def write_results(store_path, rows) -> int:
+    """Replace the contents of the store with ``rows``; return the row count.
+
+    ``rows`` may be any iterable and is consumed lazily.
+    """
+    names = TABLE_COLUMNS
+    insert_row = (
+        f"INSERT OR REPLACE INTO {TABLE} ({', '.join(names)}) "
+        f"VALUES ({', '.join('?' * len(names))})"
+    )
+    insert_languages = (
+        f"INSERT OR REPLACE INTO {LANGUAGES_TABLE} (repo, first_commit, language, sloc) "
+        "VALUES (?, ?, ?, ?)"
+    )
+    count = 0
+    conn = connect(store_path)
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM {TABLE}")
+            conn.execute(f"DELETE FROM {LANGUAGES_TABLE}")
+            for row in rows:
+                conn.execute(insert_row, tuple(_sql_value(row.get(name)) for name in names))
+                breakdown = row.get("languages") or {}
+                conn.executemany(
+                    insert_languages,
+                    ((row["repo"], row["first_commit"], lang, sloc)
+                     for lang, sloc in breakdown.items()),
+                )
+                count += 1
+        return count
+    finally:
+        conn.close()
+
+
+def merge_results(sources, store_path) -> int:
+    """Merge several result files into ``store_path``; return the row count.
+
+    Inputs are read in (repo, first_commit) order and combined with a
+    streaming k-way merge.  CSV inputs are first copied into temporary
+    stores, so that SQLite sorts them on disk instead of in memory.  When
+    several inputs contain the same (repo, first_commit), the row with the
+    newest ``analyzed_at`` wins.
+    """
+    target = Path(store_path).resolve()
+    if any(Path(source).resolve() == target for source in sources):
+        raise ResultsStoreError(f"Merge output {store_path} is also an input")
+
+    def key(row):
+        return row["repo"], row["first_commit"]
+
+    with tempfile.TemporaryDirectory(prefix="results_merge_") as spill_dir:
+        stores = []
+        for n, source in enumerate(sources):
+            if not is_store(source):
+                spilled = Path(spill_dir) / f"input-{n}.sqlite"
+                write_results(spilled, iter_results(source))
+                source = spilled
+            stores.append(source)
+        streams = [iter_results(source, order_by=["repo", "first_commit"]) for source in stores]
+        merged = heapq.merge(*streams, key=key)
+        newest = (
+            max(group, key=lambda row: row["analyzed_at"] or "")
+            for _, group in itertools.groupby(merged, key=key)
+        )
+        return write_results(store_path, newest)
+
+
+def export_csv(rows, csv_path) -> None:
+    """Write ``rows`` to ``csv_path`` in the historical CSV layout."""
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(COLUMNS), extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({
+                name: "" if row.get(name) is None else _sql_value(row.get(name))
+                for name in COLUMNS
+            })
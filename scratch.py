@@ -0,0 +1,124 @@
+"""Scratch space for repository extractions.
+
+``Scratch`` hands out one directory per repository under a private root on
+the fastest writable filesystem (``/dev/shm`` unless told otherwise) and
+deletes it as soon as the repository has been counted.  Each directory is
+reserved with an estimate of its size, and ``acquire`` blocks while the
+reservations would exceed the byte budget.  Workers therefore wait for
+space instead of filling the disk, and peak usage scales with the number of
+concurrent extractions rather than with the number of repositories.
+"""
+
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+ENV_VAR = "REPOMETRICS_SCRATCH"
+FAST_DIRS = ("/dev/shm",)
+
+# Share of the scratch filesystem's free space used when no budget is given.
+DEFAULT_BUDGET_SHARE = 0.5
+
+# tmpfs and most disk filesystems allocate whole pages/blocks per file.
+BLOCK_SIZE = 4096
+
+_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+class ScratchError(Exception):
+    """Raised when no usable scratch directory is available."""
+    pass
+
+
+def parse_size(text: str) -> int:
+    """Parse a byte count such as ``512M``, ``2G`` or ``1048576``."""
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    unit = text[-1:] if text[-1:] in _UNITS else ""
+    number = float(text[:len(text) - len(unit)]) * _UNITS[unit]
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"invalid size {text!r}")
+    return int(number)
+
+
+def format_size(nbytes: int) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if nbytes < 1024 or unit == "GiB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def disk_bytes(sizes) -> int:
+    """Estimate the space taken by files of the given sizes."""
+    return sum(-(-size // BLOCK_SIZE) * BLOCK_SIZE for size in sizes)
+
+
+def pick_base(preferred=None) -> Path:
+    """Return the first writable directory of ``preferred``, ``$REPOMETRICS_SCRATCH``,
+    ``/dev/shm`` and the system temporary directory."""
+    if preferred:
+        candidates = [preferred]
+    else:
+        candidates = [os.environ.get(ENV_VAR), *FAST_DIRS, tempfile.gettempdir()]
+    for candidate in candidates:
+        if not candidate:
+            continue
+        path = Path(candidate).expanduser()
+        if path.is_dir() and os.access(path, os.W_OK | os.X_OK):
+            return path
+    raise ScratchError(f"No writable scratch directory among: {', '.join(map(str, filter(None, candidates)))}")
+
+
+class Scratch:
+    """Byte-budgeted scratch directories with backpressure.
+
+    Thread safe: ``acquire`` may be called from several worker threads.
+    """
+
+    def __init__(self, base=None, budget=None):
+        self.base = pick_base(base)
+        self.root = Path(tempfile.mkdtemp(prefix="repometrics_", dir=self.base))
+        if budget is None:
+            budget = int(shutil.disk_usage(self.root).free * DEFAULT_BUDGET_SHARE)
+        self.budget = budget
+        self.used = 0
+        self.peak = 0
+        self._reserved = {}
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def acquire(self, name: str, nbytes: int) -> Path:
+        """Create and return an empty directory for about ``nbytes`` of files.
+
+        Blocks until the reservation fits in the budget.  A reservation
+        larger than the whole budget waits until nothing else is reserved
+        and then runs on its own.
+        """
+        with self._cond:
+            if nbytes > self.budget:
+                print(f"  WARNING: {name} needs {format_size(nbytes)}, more than the "
+                      f"scratch budget of {format_size(self.budget)}", file=sys.stderr)
+            self._cond.wait_for(lambda: self.used == 0 or self.used + nbytes <= self.budget)
+            path = Path(tempfile.mkdtemp(prefix=f"{name}_", dir=self.root))
+            self._reserved[path] = nbytes
+            self.used += nbytes
+            self.peak = max(self.peak, self.used)
+        return path
+
+    def release(self, path: Path) -> None:
+        """Delete ``path`` and return its reservation to the budget."""
+        shutil.rmtree(path, ignore_errors=True)
+        with self._cond:
+            self.used -= self._reserved.pop(path)
+            self._cond.notify_all()